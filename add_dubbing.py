@@ -0,0 +1,232 @@
+"""
+Dubbing: replace a video's speech with synthesized speech of its translated subtitles.
+
+The work is done in four steps, each a single pass over the whole video:
+
+    synthesize   Every distinct cue text is synthesized once, several at a time.
+    fit          Clips longer than the time before the next cue are sped up (up to
+                 MAX_SPEEDUP, keeping the pitch) and cut to fit.
+    mix          All clips are summed into one track with a single bincount, on top of the
+                 original audio at DUB_BACKGROUND_VOLUME.
+    mux          One ffmpeg process reads the track from stdin, encodes it and copies the
+                 video (and any subtitle tracks) unchanged.
+
+No step starts a process or writes a file per cue.
+"""
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from audio import SAMPLE_RATE, extract_audio
+from metrics import stage
+from tts_backends import get_tts
+
+# Cue texts synthesized at once
+TTS_WORKERS = int(os.getenv('LINGUAPIX_TTS_WORKERS', '4'))
+# Most a clip is sped up to fit its cue; longer clips are cut off
+MAX_SPEEDUP = float(os.getenv('LINGUAPIX_DUB_MAX_SPEEDUP', '1.5'))
+# Level of the original audio under the dub; 0 leaves only the synthesized speech
+DUB_BACKGROUND_VOLUME = float(os.getenv('LINGUAPIX_DUB_BACKGROUND_VOLUME', '0.15'))
+
+# Length of the overlap-add frames used for time stretching, in seconds
+_STRETCH_FRAME_SECONDS = 0.04
+# Fade applied where a clip is cut off, in seconds
+_FADE_SECONDS = 0.02
+
+
+def resample(clip, length):
+    """ Linearly resample a clip to `length` samples """
+    if length == len(clip) or len(clip) < 2:
+        return clip[:length] if len(clip) >= length else np.pad(clip, (0, length - len(clip)))
+    positions = np.linspace(0, len(clip) - 1, length)
+    return np.interp(positions, np.arange(len(clip)), clip).astype(np.float32)
+
+
+def time_stretch(clip, rate, sample_rate=SAMPLE_RATE):
+    """
+    Change the speed of a clip by `rate` (above 1 is faster) without changing its pitch, by
+    overlap-adding Hann-windowed frames taken `rate` times further apart than they are laid down.
+
+    Args:
+        clip (numpy.ndarray): Mono float32 samples.
+        rate (float): Speed factor.
+        sample_rate (int, optional): Sample rate of the clip. Default is 16000.
+
+    Returns:
+        numpy.ndarray: About len(clip) / rate samples.
+    """
+    length = int(round(len(clip) / rate))
+    frame = 2 * int(_STRETCH_FRAME_SECONDS * sample_rate / 2)
+    if abs(rate - 1.0) < 1e-3 or len(clip) < 2 * frame:
+        # Too short to cut into frames; a plain resample shifts the pitch only slightly
+        return resample(clip, length)
+
+    hop = frame // 2
+    count = max(1, -(-(length - frame) // hop) + 1)
+    starts = np.minimum((np.arange(count) * hop * rate).astype(np.int64), len(clip) - frame)
+    # A periodic Hann window: overlapping halves sum to exactly one
+    window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(frame) / frame)).astype(np.float32)
+    frames = clip[starts[:, None] + np.arange(frame)] * window
+    stretched = np.zeros((count + 1) * hop, dtype=np.float32)
+    stretched[:count * hop] += frames[:, :hop].ravel()
+    stretched[hop:] += frames[:, hop:].ravel()
+    return stretched[:length]
+
+
+def synthesize_cues(cues, language, workers=TTS_WORKERS, backend=None):
+    """
+    Synthesize the text of every cue, each distinct text once, with `workers` in flight.
+
+    Args:
+        cues (CueList): The translated cues.
+        language (str): The language code of the cue texts, e.g. 'yo'.
+        workers (int, optional): Texts synthesized at once. Default is LINGUAPIX_TTS_WORKERS.
+        backend (str, optional): TTS backend, see tts_backends. Defaults to LINGUAPIX_TTS_BACKEND.
+
+    Returns:
+        list of numpy.ndarray: One clip per cue at SAMPLE_RATE, empty for cues without text.
+    """
+    tts = get_tts(language, backend)
+    unique_texts = list(dict.fromkeys(text for text in cues.texts if text.strip()))
+    with stage('tts', language=language, cues=len(cues), unique_cues=len(unique_texts)) as record:
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='tts') as executor:
+            clips = dict(zip(unique_texts, executor.map(tts.synthesize, unique_texts)))
+        if tts.sample_rate != SAMPLE_RATE:
+            clips = {
+                text: resample(clip, int(round(len(clip) * SAMPLE_RATE / tts.sample_rate)))
+                for text, clip in clips.items()
+            }
+        record['speech_seconds'] = sum(len(clip) for clip in clips.values()) / SAMPLE_RATE
+    silence = np.zeros(0, dtype=np.float32)
+    return [clips.get(text, silence) for text in cues.texts]
+
+
+def fit_clips(clips, starts, total_samples, max_speedup=MAX_SPEEDUP):
+    """
+    Fit each clip into the time between its cue's start and the next cue's start (or the end
+    of the track), speeding it up by at most `max_speedup` and cutting off what still overflows.
+
+    Args:
+        clips (list of numpy.ndarray): One clip per cue.
+        starts (numpy.ndarray): Start sample of each cue, in cue order.
+        total_samples (int): Length of the track.
+        max_speedup (float, optional): Largest speed factor. Default is LINGUAPIX_DUB_MAX_SPEEDUP.
+
+    Returns:
+        list of numpy.ndarray: The fitted clips.
+    """
+    starts = np.clip(np.asarray(starts, dtype=np.int64), 0, total_samples)
+    # The room for each clip ends where the next cue starts
+    next_starts = np.minimum.accumulate(np.append(starts[1:], total_samples)[::-1])[::-1]
+    slots = np.maximum(next_starts - starts, 0)
+    fade = int(_FADE_SECONDS * SAMPLE_RATE)
+    fitted = []
+    for clip, slot in zip(clips, slots.tolist()):
+        if len(clip) > slot:
+            clip = time_stretch(clip, min(len(clip) / max(slot, 1), max_speedup))
+        if len(clip) > slot:
+            clip = clip[:slot].copy()
+            ramp = min(fade, len(clip))
+            clip[len(clip) - ramp:] *= np.linspace(1.0, 0.0, ramp, dtype=np.float32)
+        fitted.append(clip)
+    return fitted
+
+
+def mix_clips(clips, starts, total_samples, background=None, background_volume=DUB_BACKGROUND_VOLUME):
+    """
+    Sum clips into one track in a single vectorized pass.
+
+    Args:
+        clips (list of numpy.ndarray): The clips.
+        starts (numpy.ndarray): Start sample of each clip.
+        total_samples (int): Length of the track; samples past the end are dropped.
+        background (numpy.ndarray, optional): Audio laid under the clips, e.g. the original track.
+        background_volume (float, optional): Gain applied to `background`.
+
+    Returns:
+        numpy.ndarray: The mixed track, float32 in the range [-1, 1].
+    """
+    lengths = np.array([len(clip) for clip in clips], dtype=np.int64)
+    track = np.zeros(total_samples, dtype=np.float64)
+    if lengths.sum():
+        # Sample k of clip i lands at starts[i] + k
+        offsets = np.repeat(np.asarray(starts, dtype=np.int64) - np.cumsum(lengths) + lengths, lengths)
+        positions = offsets + np.arange(lengths.sum())
+        samples = np.concatenate(clips)
+        inside = (positions >= 0) & (positions < total_samples)
+        track += np.bincount(positions[inside], weights=samples[inside], minlength=total_samples)
+    if background is not None and background_volume:
+        background = background[:total_samples]
+        track[:len(background)] += background_volume * background
+    return np.clip(track, -1.0, 1.0).astype(np.float32)
+
+
+def mux_dub(video_path, track, output_path, language=None, keep_original=True):
+    """
+    Write a copy of a video with `track` as its main audio, in one ffmpeg pass: the video and
+    subtitle streams are copied and only the new track is encoded, read as PCM from stdin.
+
+    Args:
+        video_path (str): Path to the video file.
+        track (numpy.ndarray): Mono float32 samples at SAMPLE_RATE.
+        output_path (str): Path to save the dubbed video.
+        language (str, optional): ISO 639-2 code stored as the language of the dubbed track.
+        keep_original (bool, optional): Keep the original audio as a second, non-default track.
+
+    Raises:
+        subprocess.CalledProcessError: If ffmpeg fails.
+    """
+    pcm = (track * 32767.0).astype('<i2').tobytes()
+    command = [
+        'ffmpeg', '-y', '-nostdin', '-loglevel', 'error',
+        '-i', video_path,
+        '-f', 's16le', '-ar', str(SAMPLE_RATE), '-ac', '1', '-i', 'pipe:0',
+        '-map', '0:v', '-map', '1:a',
+    ]
+    if keep_original:
+        command += ['-map', '0:a?']
+    command += [
+        '-map', '0:s?',
+        '-c', 'copy',            # Video, original audio and subtitles unchanged
+        '-c:a:0', 'aac', '-b:a:0', '128k',
+        '-disposition:a:0', 'default',
+    ]
+    if keep_original:
+        command += ['-disposition:a:1', '0']
+    if language:
+        command += ['-metadata:s:a:0', f'language={language}']
+    command.append(output_path)
+    subprocess.run(command, input=pcm, capture_output=True, check=True)
+
+
+def dub_video(video_path, cues, language, output_path, audio=None, language_tag=None, backend=None):
+    """
+    Dub a video with synthesized speech of its translated cues.
+
+    Args:
+        video_path (str): Path to the video to dub, e.g. the subtitled render.
+        cues (CueList): The translated cues.
+        language (str): The language code of the cue texts, e.g. 'yo'.
+        output_path (str): Path to save the dubbed video.
+        audio (numpy.ndarray, optional): The original audio at SAMPLE_RATE, if already decoded.
+        language_tag (str, optional): ISO 639-2 code stored with the dubbed track.
+        backend (str, optional): TTS backend. Defaults to LINGUAPIX_TTS_BACKEND.
+
+    Returns:
+        str: `output_path`.
+    """
+    if audio is None:
+        audio = extract_audio(video_path)
+    total_samples = len(audio)
+    clips = synthesize_cues(cues, language, backend=backend)
+    starts = np.rint(cues.starts * SAMPLE_RATE).astype(np.int64)
+    with stage('dub_mix', cues=len(cues), audio_seconds=total_samples / SAMPLE_RATE) as record:
+        clips = fit_clips(clips, starts, total_samples)
+        track = mix_clips(clips, starts, total_samples, background=audio)
+        record['speech_seconds'] = sum(len(clip) for clip in clips) / SAMPLE_RATE
+    with stage('dub_mux', source_bytes=os.path.getsize(video_path)) as record:
+        mux_dub(video_path, track, output_path, language_tag)
+        record['output_bytes'] = os.path.getsize(output_path)
+    return output_path
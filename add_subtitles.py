@@ -1,5 +1,16 @@
 import os
 import subprocess
+from contextlib import ExitStack
+
+from subtitles import subtitle_path
+
+# How subtitles end up in the output video: burned into the frames, or as a selectable track
+BURN_IN = 'burn'
+SOFT = 'soft'
+SUBTITLE_MODES = (BURN_IN, SOFT)
+
+# ISO 639-2 codes stored in subtitle track metadata, keyed by the codes used for translation
+SUBTITLE_LANGUAGE_TAGS = {'yo': 'yor', 'en': 'eng', 'fr': 'fra', 'fon': 'fon', 'es': 'spa'}
 
 def add_subtitles_to_video(video_path, srt_path, output_path):
     """
@@ -7,15 +18,19 @@ def add_subtitles_to_video(video_path, srt_path, output_path):
     
     Args:
     video_path (str): Path to the video file.
-    srt_path (str): Path to the SRT subtitle file.
+    srt_path (str or CueList): Path to the SRT subtitle file, or the cues themselves.
     output_path (str): Path to save the output video file with subtitles.
+
+    Raises:
+    subprocess.CalledProcessError: If ffmpeg fails.
     """
-    try:
+    with subtitle_path(srt_path) as srt_path:
         # Command to embed subtitles into the video
         command = [
             'ffmpeg',
             '-i', video_path,        # Input video file
             '-vf', f"subtitles='{srt_path}'",  # Path to subtitle file
+            '-fps_mode', 'passthrough',  # Keep variable frame rate video's frames and timestamps as they are
             '-c:v', 'libx264',       # Video codec to use
             '-c:a', 'copy',          # Copy the audio without re-encoding
             '-crf', '22',            # Constant rate factor (quality of video)
@@ -26,7 +41,88 @@ def add_subtitles_to_video(video_path, srt_path, output_path):
         # Run the command with subprocess
         subprocess.run(command, check=True)
         print(f"Subtitles have been added successfully to {output_path}")
-    except subprocess.CalledProcessError as e:
-        print(f"Failed to add subtitles: {e}")
 
 
+def burn_subtitles_multi(video_path, outputs):
+    """
+    Burns several subtitle files into separate copies of a video with a single ffmpeg process,
+    which decodes the video once and splits the frames between one subtitles filter and one
+    encoder per output.
+
+    Args:
+    video_path (str): Path to the video file.
+    outputs (list of tuple): (srt_path, output_path) pairs; srt_path may also be a CueList.
+
+    Raises:
+    subprocess.CalledProcessError: If ffmpeg fails.
+    """
+    with ExitStack() as stack:
+        srt_paths = [stack.enter_context(subtitle_path(srt_path)) for srt_path, _ in outputs]
+        branches = ''.join(f'[v{i}]' for i in range(len(outputs)))
+        graph = [f"[0:v]split={len(outputs)}{branches}"]
+        graph += [f"[v{i}]subtitles='{srt_path}'[out{i}]" for i, srt_path in enumerate(srt_paths)]
+        command = ['ffmpeg', '-i', video_path, '-filter_complex', ';'.join(graph)]
+        for i, (_, output_path) in enumerate(outputs):
+            command += [
+                '-map', f'[out{i}]',     # Frames with this output's subtitles
+                '-map', '0:a?',          # Keep the audio streams, if any
+                '-fps_mode', 'passthrough',
+                '-c:v', 'libx264',
+                '-c:a', 'copy',
+                '-crf', '22',
+                '-preset', 'fast',
+                output_path
+            ]
+        subprocess.run(command, check=True)
+    print(f"Subtitles have been added successfully to {len(outputs)} videos")
+
+
+def mux_subtitle_tracks(video_path, tracks, output_path):
+    """
+    Adds one selectable subtitle track per SRT file to a video file, copying the video and
+    audio streams without re-encoding. MKV outputs get SRT tracks and everything else gets
+    mov_text tracks, the subtitle format MP4 players understand.
+
+    Args:
+    video_path (str): Path to the video file.
+    tracks (list of tuple): (srt_path, language) pairs, in track order. srt_path may also be a
+        CueList, and language is the ISO 639-2 code stored with the track, or None.
+    output_path (str): Path to save the output video file with subtitles.
+
+    Raises:
+    subprocess.CalledProcessError: If ffmpeg fails.
+    """
+    subtitle_codec = 'srt' if output_path.lower().endswith('.mkv') else 'mov_text'
+    with ExitStack() as stack:
+        command = ['ffmpeg', '-i', video_path]
+        for srt_path, _ in tracks:
+            command += ['-i', stack.enter_context(subtitle_path(srt_path))]
+        command += ['-map', '0:v', '-map', '0:a?']
+        for i in range(len(tracks)):
+            command += ['-map', f'{i + 1}:0']
+        command += ['-c:v', 'copy', '-c:a', 'copy', '-c:s', subtitle_codec]
+        for i, (_, language) in enumerate(tracks):
+            if language:
+                command += [f'-metadata:s:s:{i}', f'language={language}']
+        command.append(output_path)
+
+        subprocess.run(command, check=True)
+    print(f"Subtitle tracks have been added successfully to {output_path}")
+
+
+def mux_subtitles_to_video(video_path, srt_path, output_path, language=None):
+    """
+    Adds subtitles from an SRT file to a video file as a selectable subtitle track, copying the
+    video and audio streams without re-encoding. MKV outputs get an SRT track and everything
+    else gets a mov_text track, the subtitle format MP4 players understand.
+
+    Args:
+    video_path (str): Path to the video file.
+    srt_path (str or CueList): Path to the SRT subtitle file, or the cues themselves.
+    output_path (str): Path to save the output video file with subtitles.
+    language (str, optional): ISO 639-2 code stored as the language of the subtitle track.
+
+    Raises:
+    subprocess.CalledProcessError: If ffmpeg fails.
+    """
+    mux_subtitle_tracks(video_path, [(srt_path, language)], output_path)
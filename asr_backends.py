@@ -0,0 +1,317 @@
+"""
+CPU inference backends for the ASR models.
+
+    transformers     The reference: a full-precision transformers pipeline.
+    int8             The same pipeline with its Linear layers dynamically quantized to int8 by torch.
+    onnx             The model exported to ONNX once with optimum and run by ONNX Runtime.
+    faster-whisper   Whisper models converted once to CTranslate2 with int8 weights and run by
+                     faster-whisper. Other models fall back to int8.
+
+Converted models are kept under ASR_MODEL_DIR. Every backend returns a callable with the
+interface of a transformers ASR pipeline: pipe(inputs, return_timestamps=...) returns
+{'text': ..., 'chunks': [{'text': ..., 'timestamp': (start, end)}, ...]}.
+
+Check a backend against the reference before switching to it:
+
+    python -m asr_backends --model neoform-ai/whisper-medium-yoruba --backend faster-whisper clip1.wav clip2.mp4
+
+A clip with a .txt file of the same name is compared with that transcript; the others are
+compared with the output of the transformers backend.
+"""
+import argparse
+import logging
+import os
+import re
+import shutil
+import sys
+import time
+
+from audio import SAMPLE_RATE
+from metrics import stage
+
+TRANSFORMERS = 'transformers'
+INT8 = 'int8'
+ONNX = 'onnx'
+FASTER_WHISPER = 'faster-whisper'
+ASR_BACKENDS = (TRANSFORMERS, INT8, ONNX, FASTER_WHISPER)
+
+# Backend used when a transcription function is not given one
+ASR_BACKEND = os.getenv('LINGUAPIX_ASR_BACKEND', TRANSFORMERS)
+# Where exported and converted models are kept
+ASR_MODEL_DIR = os.getenv('LINGUAPIX_ASR_MODEL_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'linguapix', 'asr-models'))
+
+# transformers otherwise probes for TensorFlow on import, which costs seconds when it is installed
+os.environ.setdefault('USE_TF', '0')
+
+_PUNCTUATION = re.compile(r"[^\w\s']")
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_backend(backend=None):
+    """ Return the backend to use for `backend`, which defaults to LINGUAPIX_ASR_BACKEND """
+    backend = backend or ASR_BACKEND
+    if backend not in ASR_BACKENDS:
+        raise ValueError(f"Unknown ASR backend {backend}, expected one of {ASR_BACKENDS}")
+    return backend
+
+
+def _is_whisper(model_id):
+    from transformers import AutoConfig
+    return AutoConfig.from_pretrained(model_id).model_type == 'whisper'
+
+
+def _whisper_language(model_id):
+    """
+    Return the language code a Whisper model is set to transcribe, e.g. 'yo', from its
+    generation config, or None if it leaves the language to detection.
+    """
+    from transformers import GenerationConfig
+    from transformers.models.whisper.tokenization_whisper import TO_LANGUAGE_CODE
+
+    config = GenerationConfig.from_pretrained(model_id)
+    language = getattr(config, 'language', None)
+    if language is None:
+        # Older fine-tunes force the language token at the second decoder position instead
+        lang_to_id = getattr(config, 'lang_to_id', None) or {}
+        forced = dict(getattr(config, 'forced_decoder_ids', None) or [])
+        id_to_lang = {token_id: token for token, token_id in lang_to_id.items()}
+        language = id_to_lang.get(forced.get(1))
+    if language is None:
+        return None
+    language = language.strip('<|>').lower()
+    return TO_LANGUAGE_CODE.get(language, language)
+
+
+def _directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def _converted(model_id, backend, convert):
+    """
+    Return the directory holding `model_id` converted for `backend`, running `convert(directory)`
+    the first time. The conversion writes to a temporary directory that is renamed into place
+    when it succeeds, so an interrupted conversion is simply redone.
+    """
+    path = os.path.join(ASR_MODEL_DIR, backend, model_id.replace('/', '--'))
+    if os.path.isdir(path):
+        return path
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    shutil.rmtree(temporary_path, ignore_errors=True)
+    os.makedirs(temporary_path)
+    try:
+        with stage('asr_convert', model=model_id, backend=backend) as record:
+            convert(temporary_path)
+            record['model_bytes'] = _directory_size(temporary_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temporary_path, path)
+    except OSError:
+        # Another process finished the same conversion first
+        if not os.path.isdir(path):
+            raise
+    finally:
+        shutil.rmtree(temporary_path, ignore_errors=True)
+    return path
+
+
+def _load_transformers(model_id):
+    from transformers import pipeline
+    return pipeline("automatic-speech-recognition", model=model_id)
+
+
+def _load_int8(model_id):
+    import torch
+    pipe = _load_transformers(model_id)
+    # Weights of the quantized layers are no longer parameters, so measure before quantizing
+    linear_bytes = sum(
+        p.numel() * p.element_size()
+        for module in pipe.model.modules() if isinstance(module, torch.nn.Linear)
+        for p in module.parameters()
+    )
+    total_bytes = sum(p.numel() * p.element_size() for p in pipe.model.parameters())
+    pipe.model = torch.quantization.quantize_dynamic(pipe.model, {torch.nn.Linear}, dtype=torch.qint8)
+    pipe.model_bytes = total_bytes - linear_bytes * 3 // 4
+    return pipe
+
+
+def _load_onnx(model_id):
+    try:
+        from optimum.onnxruntime import ORTModelForCTC, ORTModelForSpeechSeq2Seq
+    except ImportError as e:
+        raise ImportError("The onnx ASR backend needs `pip install optimum[onnxruntime]`.") from e
+    from transformers import AutoProcessor, pipeline
+
+    model_class = ORTModelForSpeechSeq2Seq if _is_whisper(model_id) else ORTModelForCTC
+
+    def convert(directory):
+        model_class.from_pretrained(model_id, export=True).save_pretrained(directory)
+        AutoProcessor.from_pretrained(model_id).save_pretrained(directory)
+
+    path = _converted(model_id, ONNX, convert)
+    processor = AutoProcessor.from_pretrained(path)
+    pipe = pipeline(
+        "automatic-speech-recognition",
+        model=model_class.from_pretrained(path),
+        tokenizer=processor.tokenizer,
+        feature_extractor=processor.feature_extractor,
+    )
+    pipe.model_bytes = _directory_size(path)
+    return pipe
+
+
+class FasterWhisperPipeline:
+    """ Adapts a faster-whisper model to the transformers ASR pipeline interface """
+
+    def __init__(self, model, model_bytes, language=None):
+        self.model = model
+        self.model_bytes = model_bytes
+        self.language = language
+
+    def __call__(self, inputs, return_timestamps=True):
+        audio = inputs['raw'] if isinstance(inputs, dict) else inputs
+        word_timestamps = return_timestamps == 'word'
+        # Greedy decoding without VAD, like the transformers pipeline
+        segments, _ = self.model.transcribe(
+            audio, language=self.language, beam_size=1, word_timestamps=word_timestamps, vad_filter=False,
+        )
+        chunks = []
+        for segment in segments:
+            if word_timestamps:
+                chunks.extend({'text': word.word, 'timestamp': (word.start, word.end)} for word in segment.words or [])
+            else:
+                chunks.append({'text': segment.text, 'timestamp': (segment.start, segment.end)})
+        return {'text': ''.join(chunk['text'] for chunk in chunks).strip(), 'chunks': chunks}
+
+
+def _load_faster_whisper(model_id):
+    if not _is_whisper(model_id):
+        logger.info(f"{model_id} is not a Whisper model; using the int8 backend instead of faster-whisper")
+        return _load_int8(model_id)
+    try:
+        from faster_whisper import WhisperModel
+    except ImportError as e:
+        raise ImportError("The faster-whisper ASR backend needs `pip install faster-whisper`.") from e
+
+    def convert(directory):
+        from ctranslate2.converters import TransformersConverter
+        from transformers import AutoProcessor
+        TransformersConverter(model_id).convert(directory, quantization='int8', force=True)
+        # faster-whisper reads tokenizer.json and preprocessor_config.json from the model directory
+        AutoProcessor.from_pretrained(model_id).save_pretrained(directory)
+
+    path = _converted(model_id, FASTER_WHISPER, convert)
+    # Set by the long-audio workers to their share of the cores; 0 lets CTranslate2 decide
+    threads = int(os.getenv('LINGUAPIX_ASR_THREADS', '0'))
+    model = WhisperModel(path, device='cpu', compute_type='int8', cpu_threads=threads)
+    # Transcribe in the model's own language, like the reference pipeline, instead of detecting it on every clip
+    return FasterWhisperPipeline(model, _directory_size(path), language=_whisper_language(model_id))
+
+
+_LOADERS = {
+    TRANSFORMERS: _load_transformers,
+    INT8: _load_int8,
+    ONNX: _load_onnx,
+    FASTER_WHISPER: _load_faster_whisper,
+}
+
+
+def load_pipeline(model_id, backend=None):
+    """
+    Build an ASR pipeline for a model on a backend, converting the model first if needed.
+
+    Args:
+        model_id (str): Hugging Face model id of the ASR model.
+        backend (str, optional): One of ASR_BACKENDS. Defaults to LINGUAPIX_ASR_BACKEND.
+
+    Returns:
+        callable: A pipeline with the transformers ASR pipeline interface.
+    """
+    return _LOADERS[resolve_backend(backend)](model_id)
+
+
+def _words(text):
+    return _PUNCTUATION.sub(' ', text.lower()).split()
+
+
+def word_error_rate(reference, hypothesis):
+    """ Word error rate of `hypothesis` against `reference`, ignoring case and punctuation """
+    reference, hypothesis = _words(reference), _words(hypothesis)
+    if not reference:
+        return float(bool(hypothesis))
+    # Edit distance over words, one row at a time
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, start=1):
+        current = [i]
+        for j, hyp_word in enumerate(hypothesis, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1] / len(reference)
+
+
+def check_parity(model_id, backend, clips, references=None):
+    """
+    Transcribe clips with a backend and compare the text with reference transcripts.
+
+    Args:
+        model_id (str): Hugging Face model id of the ASR model.
+        backend (str): The backend to check.
+        clips (list of numpy.ndarray): Mono float32 samples at 16 kHz.
+        references (list of str, optional): The expected transcript of each clip, or None for
+            clips whose reference is the transformers backend's output.
+
+    Returns:
+        dict: Per-clip and mean word error rates, and the wall time of both backends.
+    """
+    references = list(references or [None] * len(clips))
+    inputs = [{"raw": clip, "sampling_rate": SAMPLE_RATE} for clip in clips]
+
+    results = {'model': model_id, 'backend': backend, 'reference_seconds': 0.0}
+    if any(reference is None for reference in references):
+        reference_pipe = load_pipeline(model_id, TRANSFORMERS)
+        started = time.perf_counter()
+        for i, reference in enumerate(references):
+            if reference is None:
+                references[i] = reference_pipe(inputs[i], return_timestamps=True)['text']
+        results['reference_seconds'] = time.perf_counter() - started
+        del reference_pipe
+
+    pipe = load_pipeline(model_id, backend)
+    started = time.perf_counter()
+    texts = [pipe(clip_input, return_timestamps=True)['text'] for clip_input in inputs]
+    results['backend_seconds'] = time.perf_counter() - started
+
+    results['wer'] = [word_error_rate(reference, text) for reference, text in zip(references, texts)]
+    results['mean_wer'] = sum(results['wer']) / len(results['wer']) if results['wer'] else 0.0
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare an ASR backend with reference transcripts.")
+    parser.add_argument('clips', nargs='+', help="Audio or video files; a .txt file next to a clip is its reference transcript.")
+    parser.add_argument('--model', required=True, help="Hugging Face model id.")
+    parser.add_argument('--backend', required=True, choices=ASR_BACKENDS)
+    parser.add_argument('--max-wer', type=float, default=0.05, help="Highest acceptable mean word error rate.")
+    args = parser.parse_args()
+
+    from audio import extract_audio
+
+    clips = [extract_audio(path) for path in args.clips]
+    references = []
+    for path in args.clips:
+        reference_path = os.path.splitext(path)[0] + '.txt'
+        if os.path.exists(reference_path):
+            with open(reference_path, 'r', encoding='utf-8') as file:
+                references.append(file.read())
+        else:
+            references.append(None)
+
+    results = check_parity(args.model, args.backend, clips, references)
+    for path, wer in zip(args.clips, results['wer']):
+        print(f"{path}: WER {wer:.3f}")
+    print(f"Mean WER {results['mean_wer']:.3f}, {args.backend} took {results['backend_seconds']:.1f}s"
+          + (f", transformers took {results['reference_seconds']:.1f}s" if results['reference_seconds'] else ""))
+    sys.exit(0 if results['mean_wer'] <= args.max_wer else 1)
+
+
+if __name__ == '__main__':
+    main()
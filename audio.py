@@ -0,0 +1,46 @@
+import os
+import subprocess
+
+import numpy as np
+
+from metrics import stage
+
+SAMPLE_RATE = 16000
+
+
+def _ffmpeg_pcm_command(video_path, sample_rate):
+    """ Build an ffmpeg command that writes mono 16-bit PCM to stdout """
+    return [
+        'ffmpeg',
+        '-nostdin',
+        '-loglevel', 'error',
+        '-i', video_path,        # Input video file
+        '-vn',                   # Ignore the video stream
+        '-ac', '1',              # Downmix to mono
+        '-ar', str(sample_rate), # Resample for the ASR models
+        '-f', 's16le',           # Raw little-endian PCM
+        '-acodec', 'pcm_s16le',
+        '-'                      # Write to stdout
+    ]
+
+
+def extract_audio(video_path, sample_rate=SAMPLE_RATE):
+    """
+    Decode the audio track of a video straight into memory, without writing a WAV file.
+
+    Args:
+        video_path (str): Path to the video file.
+        sample_rate (int, optional): Sample rate of the returned audio. Default is 16000.
+
+    Returns:
+        numpy.ndarray: Mono float32 samples in the range [-1, 1].
+
+    Raises:
+        subprocess.CalledProcessError: If ffmpeg fails to decode the audio.
+    """
+    with stage('audio_extract', source_bytes=os.path.getsize(video_path)) as record:
+        result = subprocess.run(_ffmpeg_pcm_command(video_path, sample_rate), capture_output=True, check=True)
+        audio = np.frombuffer(result.stdout, dtype=np.int16).astype(np.float32) / 32768.0
+        record['audio_seconds'] = len(audio) / sample_rate
+    return audio
+
@@ -0,0 +1,312 @@
+"""
+Command-line batch runner for localizing many videos without the web interface.
+
+    python batch.py courses/week1 --input-lang French --output-lang Yoruba,Fon --output-dir localized
+    python batch.py catalog.csv --output-dir localized --cpu-slots 1 --io-slots 8
+
+A manifest is a CSV file with the columns video, input_lang, output_lang and, optionally,
+subtitle_mode. Relative video paths are resolved against the manifest's directory.
+
+The subtitle languages of a video are produced together: it is transcribed once and its
+transcript translated into every language. In soft mode, that gives one video with a subtitle
+track per language.
+
+Progress is kept in batch_state.json in the output directory. Running the same command again
+skips the videos that are already done and resumes failed ones from their last completed
+stage, since failed jobs keep their work directories.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+
+from add_subtitles import BURN_IN, SUBTITLE_MODES
+from main import process_video_multi_language
+from metrics import add_stage_hook
+from result_cache import key_digest
+
+# Pipelines in flight at once
+BATCH_JOBS = int(os.getenv('LINGUAPIX_BATCH_JOBS', '4'))
+# Concurrent CPU-bound stages (audio decoding, ASR, speech synthesis, encoding); each already uses several cores
+BATCH_CPU_SLOTS = int(os.getenv('LINGUAPIX_BATCH_CPU_SLOTS', '1'))
+# Concurrent ModernMT requests
+BATCH_IO_SLOTS = int(os.getenv('LINGUAPIX_BATCH_IO_SLOTS', '8'))
+
+CPU_STAGES = ('audio_extract', 'asr_inference', 'render', 'tts', 'dub_mux')
+IO_STAGES = ('mt_batch',)
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.mkv', '.avi', '.webm')
+STATE_FILE = 'batch_state.json'
+REPORT_FILE = 'batch_report.json'
+
+DONE = 'done'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+class StageLimiter:
+    """
+    Stage hook that caps how many CPU-bound and I/O-bound pipeline stages run at once across
+    all jobs in the process. The time a stage waits for a slot is added to its metrics record
+    as wait_seconds.
+    """
+
+    def __init__(self, cpu_slots=BATCH_CPU_SLOTS, io_slots=BATCH_IO_SLOTS):
+        cpu = threading.BoundedSemaphore(cpu_slots)
+        io = threading.BoundedSemaphore(io_slots)
+        self._semaphores = {**{name: cpu for name in CPU_STAGES}, **{name: io for name in IO_STAGES}}
+
+    @contextmanager
+    def __call__(self, name, record):
+        semaphore = self._semaphores.get(name)
+        if semaphore is None:
+            yield
+            return
+        started = time.perf_counter()
+        with semaphore:
+            record['wait_seconds'] = time.perf_counter() - started
+            yield
+
+
+def _item(video_path, input_lang, output_lang, subtitle_mode):
+    item = {
+        'video': os.path.abspath(video_path),
+        'input_lang': input_lang,
+        'output_lang': output_lang,
+        'subtitle_mode': subtitle_mode or BURN_IN,
+    }
+    item['id'] = key_digest(item)[:16]
+    return item
+
+
+def load_items(source, input_lang=None, output_langs=(), subtitle_mode=BURN_IN):
+    """
+    List the work described by a directory of videos or by a CSV manifest.
+
+    Args:
+        source (str): A directory, whose videos are all translated into every language in
+            `output_langs`, or a CSV manifest.
+        input_lang (str, optional): Spoken language of the videos in a directory.
+        output_langs (list of str, optional): Subtitle languages for the videos in a directory.
+        subtitle_mode (str, optional): 'burn' or 'soft', for directories and manifest rows without one.
+
+    Returns:
+        list of dict: One item per (video, subtitle language) pair.
+    """
+    if os.path.isdir(source):
+        if not input_lang or not output_langs:
+            raise ValueError("A directory needs --input-lang and --output-lang.")
+        videos = sorted(
+            os.path.join(source, name) for name in os.listdir(source)
+            if name.lower().endswith(VIDEO_EXTENSIONS) and '_subtitled_' not in name
+        )
+        return [_item(video, input_lang, lang, subtitle_mode) for video in videos for lang in output_langs]
+
+    base = os.path.dirname(os.path.abspath(source))
+    items = []
+    with open(source, 'r', encoding='utf-8', newline='') as file:
+        for line, row in enumerate(csv.DictReader(file), start=2):
+            if not row.get('video') or not row.get('input_lang') or not row.get('output_lang'):
+                raise ValueError(f"{source}:{line}: video, input_lang and output_lang are required.")
+            mode = row.get('subtitle_mode') or subtitle_mode
+            if mode not in SUBTITLE_MODES:
+                raise ValueError(f"{source}:{line}: unknown subtitle mode {mode}.")
+            items.append(_item(os.path.join(base, row['video']), row['input_lang'], row['output_lang'], mode))
+    return items
+
+
+def _output_names(items):
+    """ Name outputs <video>_<language>; videos that share a file name also get the item id """
+    stems = {}
+    for item in items:
+        stem = os.path.splitext(os.path.basename(item['video']))[0]
+        stems.setdefault((stem, item['output_lang']), []).append(item)
+    names = {}
+    for (stem, lang), group in stems.items():
+        for item in group:
+            names[item['id']] = f"{stem}_{lang}" if len(group) == 1 else f"{stem}_{lang}_{item['id'][:8]}"
+    return names
+
+
+def group_items(items):
+    """
+    Gather the items that can share a transcript: the same video, spoken language and subtitle mode.
+
+    Returns:
+        list of list of dict: The groups, in the order their first item appears.
+    """
+    groups = {}
+    for item in items:
+        groups.setdefault((item['video'], item['input_lang'], item['subtitle_mode']), {})[item['id']] = item
+    return [list(group.values()) for group in groups.values()]
+
+
+class BatchRun:
+    """ Processes a list of items, recording each outcome in the state file as it finishes """
+
+    def __init__(self, items, output_dir, jobs=BATCH_JOBS):
+        self.items = items
+        self.output_dir = output_dir
+        self.jobs = jobs
+        self.state_path = os.path.join(output_dir, STATE_FILE)
+        self.names = _output_names(items)
+        self._lock = threading.Lock()
+        self._finished = 0
+        os.makedirs(output_dir, exist_ok=True)
+        self.state = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r', encoding='utf-8') as file:
+                self.state = json.load(file)
+
+    def _save_state(self):
+        temporary_path = self.state_path + '.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            json.dump(self.state, file, indent=2, sort_keys=True)
+        os.replace(temporary_path, self.state_path)
+
+    def _print(self, message):
+        with self._lock:
+            print(f"[{self._finished}/{len(self.items)}] {message}", flush=True)
+
+    def _output_path(self, group, lang, result):
+        """ Return where the video made for `lang` goes; soft-mode groups share one video with a track per language """
+        extension = os.path.splitext(result)[1]
+        if group[0]['subtitle_mode'] == BURN_IN or len(group) == 1:
+            item = next(item for item in group if item['output_lang'] == lang)
+            return os.path.join(self.output_dir, self.names[item['id']] + extension)
+        stem = os.path.splitext(os.path.basename(group[0]['video']))[0]
+        name = f"{stem}_{'_'.join(item['output_lang'] for item in group)}"
+        if self.names[group[0]['id']] != f"{stem}_{group[0]['output_lang']}":
+            # Another video in the batch has the same file name
+            name += f"_{key_digest([item['id'] for item in group])[:8]}"
+        return os.path.join(self.output_dir, name + extension)
+
+    def _run_group(self, group):
+        langs = [item['output_lang'] for item in group]
+        label = f"{os.path.basename(group[0]['video'])} -> {', '.join(langs)}"
+        started = time.time()
+        results = process_video_multi_language(
+            group[0]['video'], group[0]['input_lang'], langs,
+            progress=lambda stage, fraction: self._print(f"{label}: {stage}"),
+            subtitle_mode=group[0]['subtitle_mode'],
+            # Stable across runs, so a rerun resumes the same work directory; unlike the default
+            # content digest it is also unique when two files in the batch have the same contents
+            job_id=f"batch-{key_digest([item['id'] for item in group])[:16]}",
+            keep_on_failure=True,
+        )
+        seconds = time.time() - started
+        outcomes = []
+        moved = {}
+        for item in group:
+            outcome = {**item, 'started': started, 'seconds': seconds}
+            if results is None:
+                outcome.update(status=FAILED, error="The pipeline failed; see the log for details.")
+            else:
+                result = results[item['output_lang']]
+                if result not in moved:
+                    moved[result] = self._output_path(group, item['output_lang'], result)
+                    shutil.move(result, moved[result])
+                outcome.update(status=DONE, output=moved[result])
+            outcomes.append(outcome)
+
+        with self._lock:
+            self._finished += len(group)
+            for outcome in outcomes:
+                self.state[outcome['id']] = outcome
+            self._save_state()
+        self._print(f"{label}: {outcomes[0]['status']} in {seconds:.1f}s")
+        return outcomes
+
+    def run(self):
+        """
+        Process every item that is not already done.
+
+        Returns:
+            list of dict: The outcome of every item, in input order.
+        """
+        outcomes = {}
+        pending = []
+        for item in self.items:
+            previous = self.state.get(item['id'])
+            if previous and previous['status'] == DONE and os.path.exists(previous['output']):
+                outcomes[item['id']] = {**previous, 'status': SKIPPED}
+            else:
+                pending.append(item)
+        self._finished = len(outcomes)
+        if outcomes:
+            self._print(f"Skipping {len(outcomes)} items finished by an earlier run")
+
+        with ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix='batch-job') as executor:
+            futures = {executor.submit(self._run_group, group): group for group in group_items(pending)}
+            for future in as_completed(futures):
+                group = futures[future]
+                try:
+                    outcomes.update((outcome['id'], outcome) for outcome in future.result())
+                except Exception as e:
+                    with self._lock:
+                        self._finished += len(group)
+                        for item in group:
+                            outcomes[item['id']] = self.state[item['id']] = {**item, 'status': FAILED, 'error': str(e)}
+                        self._save_state()
+                    self._print(f"{os.path.basename(group[0]['video'])} -> "
+                                f"{', '.join(item['output_lang'] for item in group)}: failed: {e}")
+        return [outcomes[item['id']] for item in self.items]
+
+
+def write_report(outcomes, output_dir, wall_seconds):
+    """ Write the summary report as JSON and print it as a table """
+    counts = {status: sum(1 for o in outcomes if o['status'] == status) for status in (DONE, SKIPPED, FAILED)}
+    report = {'wall_seconds': wall_seconds, **counts, 'items': outcomes}
+    report_path = os.path.join(output_dir, REPORT_FILE)
+    with open(report_path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+
+    print()
+    print(f"{'video':<40}{'language':<12}{'status':<10}{'seconds':>9}")
+    for outcome in outcomes:
+        seconds = f"{outcome['seconds']:.1f}" if outcome.get('seconds') is not None else '-'
+        print(f"{os.path.basename(outcome['video'])[:39]:<40}{outcome['output_lang']:<12}{outcome['status']:<10}{seconds:>9}")
+    print(f"\n{counts[DONE]} done, {counts[SKIPPED]} skipped, {counts[FAILED]} failed in {wall_seconds:.1f}s. "
+          f"Report written to {report_path}")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Translate and subtitle many videos.")
+    parser.add_argument('source', help="A directory of videos or a CSV manifest.")
+    parser.add_argument('--input-lang', help="Spoken language of the videos in a directory, e.g. French.")
+    parser.add_argument('--output-lang', help="Comma-separated subtitle languages for a directory, e.g. Yoruba,Fon.")
+    parser.add_argument('--subtitle-mode', default=BURN_IN, choices=SUBTITLE_MODES)
+    parser.add_argument('--output-dir', default='localized', help="Where subtitled videos, the state file and the report go.")
+    parser.add_argument('--jobs', type=int, default=BATCH_JOBS, help="Videos processed at once, each in all its languages.")
+    parser.add_argument('--cpu-slots', type=int, default=BATCH_CPU_SLOTS, help="Concurrent audio decoding, ASR, speech synthesis and encoding stages.")
+    parser.add_argument('--io-slots', type=int, default=BATCH_IO_SLOTS, help="Concurrent translation requests.")
+    parser.add_argument('--verbose', action='store_true', help="Show the pipeline's debug log.")
+    args = parser.parse_args(argv)
+
+    output_langs = [lang.strip() for lang in (args.output_lang or '').split(',') if lang.strip()]
+    try:
+        items = load_items(args.source, args.input_lang, output_langs, args.subtitle_mode)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if not items:
+        parser.error(f"No videos found in {args.source}")
+
+    # main configures the root logger at import time; keep the console to progress lines
+    logging.getLogger().setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+
+    add_stage_hook(StageLimiter(args.cpu_slots, args.io_slots))
+    started = time.time()
+    outcomes = BatchRun(items, args.output_dir, args.jobs).run()
+    report = write_report(outcomes, args.output_dir, time.time() - started)
+    return 1 if report[FAILED] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
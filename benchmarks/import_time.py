@@ -0,0 +1,89 @@
+"""
+Import-time benchmark. Imports each module in a fresh interpreter under `python -X importtime`
+and reports its cumulative import time and the heaviest modules it pulls in, so a change that
+drags a large dependency into startup shows up before it reaches the servers.
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --modules jobs,image_gen --max-seconds 1.5
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# What frontend.py imports before its first widget renders, then what the first job loads
+DEFAULT_MODULES = 'streamlit,add_subtitles,dendi_gallery,jobs,image_gen,model_registry,translation'
+
+
+def _import_times(statement):
+    """ Run `statement` in a fresh interpreter and return its (cumulative seconds, module) import pairs """
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement], cwd=REPO_DIR, capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        raise ImportError(completed.stderr.strip().splitlines()[-1])
+    # Lines look like "import time:   self [us] | cumulative | imported package"
+    imports = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imports.append((int(cumulative) / 1e6, name.strip()))
+    return imports
+
+
+def measure_import(module, repeats=3):
+    """
+    Import `module` in fresh interpreters and keep the fastest run.
+
+    Args:
+        module (str): Dotted module name, importable from the repository root.
+        repeats (int, optional): Number of fresh interpreters to try. Default is 3.
+
+    Returns:
+        dict: The total import time in seconds and the (seconds, module) pairs of the imported
+        modules, slowest first, both from the fastest run. None if the import failed.
+    """
+    # Modules the interpreter imports at startup (site, encodings, ...) are not the module's cost
+    startup = {name for _, name in _import_times('pass')}
+    best = None
+    for _ in range(repeats):
+        try:
+            imports = [(seconds, name) for seconds, name in _import_times(f'import {module}') if name not in startup]
+        except ImportError as e:
+            print(f"import {module} failed: {e}")
+            return None
+        total = next(seconds for seconds, name in reversed(imports) if name == module)
+        if best is None or total < best['seconds']:
+            best = {'seconds': total, 'imports': sorted(imports, reverse=True)}
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold import times of the app's modules.")
+    parser.add_argument('--modules', default=DEFAULT_MODULES, help="Comma-separated modules to import.")
+    parser.add_argument('--repeats', type=int, default=3, help="Fresh interpreters per module; the fastest run counts.")
+    parser.add_argument('--top', type=int, default=5, help="Heaviest dependencies to list per module.")
+    parser.add_argument('--max-seconds', type=float, help="Fail if any module takes longer than this to import.")
+    args = parser.parse_args()
+
+    slow = []
+    for module in [name.strip() for name in args.modules.split(',') if name.strip()]:
+        result = measure_import(module, args.repeats)
+        if result is None:
+            slow.append(module)
+            continue
+        print(f"{module:<24}{result['seconds']:>8.3f}s")
+        for seconds, name in [entry for entry in result['imports'] if entry[1] != module][:args.top]:
+            print(f"    {name:<40}{seconds:>8.3f}s")
+        if args.max_seconds is not None and result['seconds'] > args.max_seconds:
+            slow.append(module)
+
+    if slow:
+        print(f"\nOver the limit or failed: {', '.join(slow)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
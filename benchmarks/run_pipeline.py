@@ -0,0 +1,207 @@
+"""
+Offline benchmark for the subtitle pipeline.
+
+Runs process_video_with_subtitles end to end, and each stage on its own, against generated
+test videos with a stub ASR model and a fake ModernMT client, so no network or model
+download is needed. Every case runs in a fresh subprocess with empty caches, which keeps
+the peak RSS figures separate.
+
+    python -m benchmarks.run_pipeline --lengths 30,120,600 --save-baseline
+    python -m benchmarks.run_pipeline --lengths 30,120,600 --baseline benchmarks/baseline.json
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.videos import generate_test_video
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_VIDEO_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'linguapix', 'bench-videos')
+# Metrics compared against the baseline; lower is better for all of them
+COMPARED_METRICS = ('wall', 'audio', 'transcript', 'translation', 'render')
+
+
+def _peak_rss_mb():
+    """ Peak resident set size of this process and of its largest child (ffmpeg), in MB """
+    self_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return self_kb / 1024, children_kb / 1024
+
+
+def _run_end_to_end(video_path, args):
+    from main import process_video_with_subtitles
+
+    marks = []
+    started = time.perf_counter()
+    output_path = process_video_with_subtitles(
+        video_path, 'French', 'Yoruba', progress=lambda stage, fraction: marks.append((stage, time.perf_counter())),
+        subtitle_mode=args.subtitle_mode,
+    )
+    wall = time.perf_counter() - started
+    if output_path is None:
+        raise RuntimeError("The pipeline failed; see the log above.")
+    os.remove(output_path)
+
+    # Each progress mark starts a stage, so a stage lasts until the next mark
+    stages = {}
+    for (stage, at), (_, next_at) in zip(marks, marks[1:]):
+        stages[stage] = next_at - at
+    return wall, stages
+
+
+def _run_stages(video_path, work_dir, args):
+    from add_subtitles import BURN_IN, mux_subtitles_to_video
+    from audio import extract_audio
+    from parallel_burn import burn_subtitles_parallel
+    from transcription import transcribe_and_create_srt
+    from translation import translate_srt
+
+    srt_path = os.path.join(work_dir, 'transcript.srt')
+    translated_srt_path = os.path.join(work_dir, 'translation.srt')
+    output_path = os.path.join(work_dir, 'render.mp4')
+    stages = {}
+
+    started = time.perf_counter()
+    audio = extract_audio(video_path)
+    stages['audio'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    transcribe_and_create_srt(audio, srt_path)
+    stages['transcript'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    translate_srt(srt_path, 'fr', 'yo', translated_srt_path)
+    stages['translation'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    if args.subtitle_mode == BURN_IN:
+        burn_subtitles_parallel(video_path, translated_srt_path, output_path)
+    else:
+        mux_subtitles_to_video(video_path, translated_srt_path, output_path)
+    stages['render'] = time.perf_counter() - started
+
+    return sum(stages.values()), stages
+
+
+def run_worker(args):
+    """ Measure one case in this process and print the result as a JSON line """
+    with tempfile.TemporaryDirectory(prefix='linguapix-bench-') as work_dir:
+        # Everything that caches between runs points into the throwaway directory
+        os.environ['LINGUAPIX_ASR_LOADER'] = 'benchmarks.stubs:load_stub_pipeline'
+        os.environ['LINGUAPIX_STUB_ASR_SPEED'] = str(args.asr_speed)
+        os.environ['LINGUAPIX_TM_PATH'] = os.path.join(work_dir, 'tm.sqlite3')
+        os.environ['LINGUAPIX_RESULT_CACHE_DIR'] = os.path.join(work_dir, 'results')
+        os.environ['LINGUAPIX_WORK_DIR'] = os.path.join(work_dir, 'work')
+
+        import translation
+        from benchmarks.stubs import FakeMT
+
+        fake_mt = FakeMT(latency=args.mt_latency)
+        translation.set_mt_client(fake_mt)
+
+        if args.mode == 'e2e':
+            wall, stages = _run_end_to_end(args.video, args)
+        else:
+            wall, stages = _run_stages(args.video, work_dir, args)
+
+    rss_mb, child_rss_mb = _peak_rss_mb()
+    print(json.dumps({
+        'wall': wall,
+        **stages,
+        'throughput': args.seconds / wall,
+        'peak_rss_mb': rss_mb,
+        'peak_child_rss_mb': child_rss_mb,
+        'mt_requests': fake_mt.requests,
+    }))
+
+
+def _run_case(video_path, seconds, mode, args):
+    command = [
+        sys.executable, '-m', 'benchmarks.run_pipeline', '--worker',
+        '--video', video_path, '--seconds', str(seconds), '--mode', mode,
+        '--asr-speed', str(args.asr_speed), '--mt-latency', str(args.mt_latency),
+        '--subtitle-mode', args.subtitle_mode,
+    ]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise RuntimeError(f"Benchmark case {mode} {seconds}s failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def compare(results, baseline, tolerance):
+    """
+    Find metrics that got slower than the baseline by more than `tolerance`.
+
+    Returns:
+        list of str: One line per regression.
+    """
+    regressions = []
+    for case, metrics in results.items():
+        for metric in COMPARED_METRICS:
+            old = baseline.get(case, {}).get(metric)
+            new = metrics.get(metric)
+            if old and new is not None and new > old * (1 + tolerance):
+                regressions.append(f"{case} {metric}: {old:.2f}s -> {new:.2f}s (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the subtitle pipeline offline.")
+    parser.add_argument('--lengths', default='30,120,600', help="Comma-separated test video lengths in seconds.")
+    parser.add_argument('--modes', default='e2e,stages', help="Comma-separated subset of e2e,stages.")
+    parser.add_argument('--subtitle-mode', default='burn', choices=['burn', 'soft'])
+    parser.add_argument('--asr-speed', type=float, default=20.0, help="Stub ASR speed as a multiple of real time.")
+    parser.add_argument('--mt-latency', type=float, default=0.2, help="Fake MT round-trip latency in seconds.")
+    parser.add_argument('--video-dir', default=DEFAULT_VIDEO_DIR, help="Where generated test videos are kept.")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline JSON file to compare against or write.")
+    parser.add_argument('--save-baseline', action='store_true', help="Write the results as the new baseline.")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed slowdown before a metric counts as a regression.")
+    # Internal: measure a single case in a fresh process
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--video', help=argparse.SUPPRESS)
+    parser.add_argument('--seconds', type=float, help=argparse.SUPPRESS)
+    parser.add_argument('--mode', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    results = {}
+    for seconds in [int(length) for length in args.lengths.split(',')]:
+        video_path = generate_test_video(args.video_dir, seconds)
+        for mode in args.modes.split(','):
+            case = f"{mode}-{args.subtitle_mode}-{seconds}s"
+            print(f"Running {case}...", flush=True)
+            results[case] = _run_case(video_path, seconds, mode, args)
+
+    print()
+    print(f"{'case':<24}{'wall':>8}{'audio':>8}{'asr':>8}{'mt':>8}{'render':>8}{'x rt':>8}{'rss MB':>9}{'child MB':>11}")
+    for case, m in results.items():
+        print(f"{case:<24}{m['wall']:>8.2f}{m.get('audio', 0):>8.2f}{m.get('transcript', 0):>8.2f}"
+              f"{m.get('translation', 0):>8.2f}{m.get('render', 0):>8.2f}{m['throughput']:>8.1f}"
+              f"{m['peak_rss_mb']:>9.0f}{m['peak_child_rss_mb']:>11.0f}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        if regressions:
+            print("\nRegressions against the baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions against the baseline.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import os
+import threading
+import time
+
+from audio import SAMPLE_RATE
+
+# How many seconds of audio the stub ASR "transcribes" per second of wall time
+STUB_ASR_SPEED = float(os.getenv('LINGUAPIX_STUB_ASR_SPEED', '20'))
+# Length of each synthetic chunk, in seconds of audio
+STUB_CHUNK_SECONDS = float(os.getenv('LINGUAPIX_STUB_CHUNK_SECONDS', '3'))
+
+_PHRASES = [
+    "bonjour à tous",
+    "aujourd'hui nous parlons de l'eau",
+    "l'eau est précieuse",
+    "il faut la protéger",
+    "merci de votre attention",
+]
+
+
+class StubASRPipeline:
+    """
+    Stand-in for a transformers ASR pipeline. It returns synthetic chunks that cover the input
+    and sleeps long enough to run at STUB_ASR_SPEED times real time.
+    """
+
+    def __init__(self, model_id, speed=STUB_ASR_SPEED, chunk_seconds=STUB_CHUNK_SECONDS):
+        self.model_id = model_id
+        self.speed = speed
+        self.chunk_seconds = chunk_seconds
+
+    def __call__(self, inputs, return_timestamps=True):
+        samples = inputs['raw'] if isinstance(inputs, dict) else None
+        if samples is None:
+            raise ValueError("The stub ASR pipeline only accepts in-memory audio.")
+        duration = len(samples) / inputs.get('sampling_rate', SAMPLE_RATE)
+        time.sleep(duration / self.speed)
+
+        chunks = []
+        start = 0.0
+        while start < duration:
+            end = min(duration, start + self.chunk_seconds)
+            chunks.append({'text': _PHRASES[len(chunks) % len(_PHRASES)], 'timestamp': (start, end)})
+            start = end
+        return {'text': ' '.join(chunk['text'] for chunk in chunks), 'chunks': chunks}
+
+
+def load_stub_pipeline(model_id):
+    """ Pipeline loader for LINGUAPIX_ASR_LOADER=benchmarks.stubs:load_stub_pipeline """
+    return StubASRPipeline(model_id)
+
+
+class _Translation:
+    __slots__ = ('translation',)
+
+    def __init__(self, translation):
+        self.translation = translation
+
+
+class FakeMT:
+    """
+    Stand-in for the ModernMT client. Every call waits `latency` seconds plus `per_item` seconds
+    per string, mimicking a network round trip, and returns the input reversed.
+    """
+
+    def __init__(self, latency=0.2, per_item=0.001):
+        self.latency = latency
+        self.per_item = per_item
+        self.requests = 0
+        self.strings = 0
+        self._lock = threading.Lock()
+
+    def translate(self, source, target, q, *args, **kwargs):
+        texts = q if isinstance(q, list) else [q]
+        with self._lock:
+            self.requests += 1
+            self.strings += len(texts)
+        time.sleep(self.latency + self.per_item * len(texts))
+        results = [_Translation(text[::-1]) for text in texts]
+        return results if isinstance(q, list) else results[0]
@@ -0,0 +1,40 @@
+import os
+import subprocess
+
+
+def generate_test_video(directory, seconds, width=640, height=360, fps=25):
+    """
+    Generate a synthetic test video with ffmpeg, or reuse one generated earlier.
+
+    The audio alternates two seconds of noise with half a second of silence, roughly like
+    speech with pauses, so the silence-based chunking has boundaries to find.
+
+    Args:
+        directory (str): Where generated videos are kept.
+        seconds (int): Length of the video.
+        width (int, optional): Frame width. Default is 640.
+        height (int, optional): Frame height. Default is 360.
+        fps (int, optional): Frame rate. Default is 25.
+
+    Returns:
+        str: Path of the video.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'test_{seconds}s_{width}x{height}.mp4')
+    if os.path.exists(path):
+        return path
+
+    temporary_path = path + '.part.mp4'
+    command = [
+        'ffmpeg', '-nostdin', '-loglevel', 'error', '-y',
+        '-f', 'lavfi', '-i', f'testsrc2=size={width}x{height}:rate={fps}',
+        '-f', 'lavfi', '-i', 'anoisesrc=color=pink:sample_rate=44100:amplitude=0.3',
+        '-af', "volume='if(lt(mod(t,2.5),2),1,0)':eval=frame",
+        '-t', str(seconds),
+        '-c:v', 'libx264', '-preset', 'veryfast', '-g', str(fps * 2),
+        '-c:a', 'aac',
+        temporary_path
+    ]
+    subprocess.run(command, check=True)
+    os.replace(temporary_path, path)
+    return path
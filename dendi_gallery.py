@@ -0,0 +1,151 @@
+import io
+import logging
+import os
+import random
+import threading
+
+GALLERY_DIR = os.getenv('LINGUAPIX_DENDI_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dendi'))
+# Seconds between checks of the gallery directory for added, removed or replaced images
+GALLERY_POLL_SECONDS = float(os.getenv('LINGUAPIX_DENDI_POLL_SECONDS', '5'))
+THUMBNAIL_SIZE = 256
+
+logger = logging.getLogger(__name__)
+
+
+class GalleryImage:
+    """ One gallery image: its file name, encoded bytes and a small WebP thumbnail """
+
+    __slots__ = ('name', 'data', 'thumbnail')
+
+    def __init__(self, name, data, thumbnail):
+        self.name = name
+        self.data = data
+        self.thumbnail = thumbnail
+
+
+def make_thumbnail(data, size=THUMBNAIL_SIZE):
+    """ Return a WebP thumbnail of an encoded image, or the image itself if Pillow is not installed """
+    try:
+        from PIL import Image
+    except ImportError:
+        return data
+    with Image.open(io.BytesIO(data)) as image:
+        image.thumbnail((size, size))
+        output = io.BytesIO()
+        image.save(output, format='WEBP', quality=80)
+    return output.getvalue()
+
+
+def _signature(root):
+    """ Cheap fingerprint of the gallery files: their paths, sizes and modification times """
+    entries = []
+    if not os.path.isdir(root):
+        return ()
+    for prompt_entry in os.scandir(root):
+        if not prompt_entry.is_dir():
+            continue
+        for entry in os.scandir(prompt_entry.path):
+            if entry.is_file() and entry.name.lower().endswith('.webp'):
+                stat = entry.stat()
+                entries.append((prompt_entry.name, entry.name, stat.st_size, stat.st_mtime_ns))
+    return tuple(sorted(entries))
+
+
+class GalleryIndex:
+    """
+    In-memory index of the Dendi gallery. Each subdirectory of `root` holds the images for
+    one prompt (dendi/1, dendi/2, ...). All images and their thumbnails are loaded once, so
+    picking one is a dictionary lookup and a random choice, with no filesystem access. A
+    background thread rescans the directory every `poll_seconds` and swaps in a new index
+    when its contents change.
+    """
+
+    def __init__(self, root=GALLERY_DIR, poll_seconds=GALLERY_POLL_SECONDS):
+        self.root = root
+        self.poll_seconds = poll_seconds
+        self._images = {}
+        self._signature = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+        self.refresh()
+
+    def refresh(self):
+        """
+        Rescan the gallery directory if it changed since the last scan.
+
+        Returns:
+            bool: True if the index was rebuilt.
+        """
+        with self._lock:
+            signature = _signature(self.root)
+            if signature == self._signature:
+                return False
+            images = {}
+            for prompt, name, _, _ in signature:
+                try:
+                    with open(os.path.join(self.root, prompt, name), 'rb') as file:
+                        data = file.read()
+                    thumbnail = make_thumbnail(data)
+                except (OSError, ValueError) as e:
+                    # Skip files removed mid-scan or that are not readable images
+                    logger.error(f"Skipping gallery image {prompt}/{name}: {e}")
+                    continue
+                images.setdefault(prompt, []).append(GalleryImage(name, data, thumbnail))
+            # Readers only ever see a complete index
+            self._images = {prompt: tuple(entries) for prompt, entries in images.items()}
+            self._signature = signature
+        logger.info(f"Indexed {sum(len(entries) for entries in self._images.values())} gallery images "
+                    f"for {len(self._images)} prompts in {self.root}")
+        return True
+
+    def prompts(self):
+        """ Return the prompt names (subdirectory names) that have images """
+        return sorted(self._images)
+
+    def images(self, prompt):
+        """ Return every image for a prompt, as a tuple of GalleryImage """
+        return self._images.get(str(prompt), ())
+
+    def pick(self, prompt):
+        """
+        Pick a random image for a prompt.
+
+        Args:
+            prompt (str or int): The prompt's subdirectory name, e.g. 1.
+
+        Returns:
+            GalleryImage: The image, or None if the prompt has no images.
+        """
+        images = self.images(prompt)
+        return random.choice(images) if images else None
+
+    def watch(self):
+        """ Start the background thread that keeps the index in sync with the directory """
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, name='dendi-gallery-watcher', daemon=True)
+            self._watcher.start()
+        return self
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.refresh()
+            except OSError as e:
+                logger.error(f"Failed to rescan the gallery in {self.root}: {e}")
+
+    def stop(self):
+        self._stop.set()
+
+
+_gallery = None
+_gallery_lock = threading.Lock()
+
+
+def get_dendi_gallery():
+    """ Return the process-wide gallery index, loading it and starting its watcher on first use """
+    global _gallery
+    with _gallery_lock:
+        if _gallery is None:
+            _gallery = GalleryIndex().watch()
+        return _gallery
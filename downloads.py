@@ -0,0 +1,300 @@
+"""
+Serving finished videos from disk, without reading them into the Python process.
+
+A small HTTP server on LINGUAPIX_FILES_PORT (8502 by default) answers GET and HEAD requests for
+the files in the upload directories, honouring Range headers and sending the bytes with sendfile.
+It also accepts chunked uploads with PUT, so large videos never pass through Streamlit.
+LINGUAPIX_FILES_URL is the address browsers use to reach it, e.g. behind a reverse proxy.
+With the port set to an empty value, or when it cannot be bound, the app falls back to
+Streamlit's own upload and download widgets.
+
+    GET  /files/<token>/<name>     Download a file, whole or in byte ranges.
+    PUT  /uploads/<token>/<name>   Upload a chunk; Content-Range: bytes <first>-<last>/<total>.
+
+Uploads are accepted only for tokens the app has reserved with uploads.reserve_upload, only
+until they are complete, and only while the upload directories stay within their quota.
+"""
+import json
+import logging
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote
+
+from uploads import (MANIFEST_NAME, MAX_UPLOAD_MB, UPLOAD_DIR, UPLOAD_QUOTA_MB, UploadError, UploadSpool,
+                     check_quota, is_reserved, is_upload_token, purge_expired_uploads, safe_filename)
+
+# Next to Streamlit's own 8501; an empty value disables the file server
+FILES_PORT = os.getenv('LINGUAPIX_FILES_PORT', '8502')
+# Interface the file server listens on; only this machine by default, e.g. behind a reverse proxy
+FILES_HOST = os.getenv('LINGUAPIX_FILES_HOST', '127.0.0.1')
+FILES_URL = os.getenv('LINGUAPIX_FILES_URL') or (f'http://localhost:{FILES_PORT}' if FILES_PORT else None)
+# Origin allowed to call the file server from a page; the upload widget runs in a sandboxed
+# Streamlit component, whose requests come from a "null" origin unless it is served elsewhere
+FILES_CORS_ORIGIN = os.getenv('LINGUAPIX_FILES_CORS_ORIGIN', '*')
+
+# Bytes read from an upload request at a time
+_READ_BYTES = 1024 * 1024
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+_CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+_TYPES = {'.mp4': 'video/mp4', '.mov': 'video/quicktime', '.mkv': 'video/x-matroska', '.avi': 'video/x-msvideo'}
+
+logger = logging.getLogger(__name__)
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range Range header.
+
+    Args:
+        header (str): The header value, e.g. 'bytes=0-1023', 'bytes=1024-' or 'bytes=-500'.
+        size (int): Size of the file.
+
+    Returns:
+        tuple: The first and last byte positions, both inclusive, or None for a header this
+        parser does not handle (the whole file is then sent).
+
+    Raises:
+        ValueError: If the range lies outside the file.
+    """
+    match = _RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # A suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range.")
+        return max(0, size - length), size - 1
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first >= size or last < first:
+        raise ValueError(f"Range {header} is outside a file of {size} bytes.")
+    return first, last
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = 'LinguapixFiles'
+    # Set by FileServer
+    root = UPLOAD_DIR
+    max_bytes = MAX_UPLOAD_MB * 1024 * 1024
+    quota_bytes = UPLOAD_QUOTA_MB * 1024 * 1024
+    cors_origin = FILES_CORS_ORIGIN
+    spools = None
+    spools_lock = None
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def _cors(self):
+        # The upload widget runs on the Streamlit page, which is served from another port
+        self.send_header('Access-Control-Allow-Origin', self.cors_origin)
+        self.send_header('Access-Control-Allow-Methods', 'GET, HEAD, PUT, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Range, Content-Type, Range')
+        self.send_header('Access-Control-Expose-Headers', 'Content-Range, Content-Length, Accept-Ranges')
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self._cors()
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        if status >= 400:
+            # Whatever is left of the request body is never read
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _route(self, prefix):
+        """ Return the (token, name) of a /<prefix>/<token>/<name> path, or None """
+        parts = self.path.split('?', 1)[0].split('/')
+        if len(parts) != 4 or parts[1] != prefix or not is_upload_token(parts[2]):
+            return None
+        name = safe_filename(unquote(parts[3]))
+        return None if name == MANIFEST_NAME else (parts[2], name)
+
+    def do_OPTIONS(self):
+        self.send_response(204)
+        self._cors()
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._serve_file(send_body=False)
+
+    def do_GET(self):
+        self._serve_file(send_body=True)
+
+    def _serve_file(self, send_body):
+        route = self._route('files')
+        path = os.path.join(self.root, *route) if route else None
+        if path is None or not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            try:
+                byte_range = parse_range(self.headers.get('Range', ''), size)
+            except ValueError:
+                self.send_response(416)
+                self._cors()
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            first, last = byte_range or (0, size - 1)
+            self.send_response(206 if byte_range else 200)
+            self._cors()
+            self.send_header('Content-Type', _TYPES.get(os.path.splitext(path)[1], 'application/octet-stream'))
+            self.send_header('Content-Length', str(last - first + 1))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Disposition', f"attachment; filename*=UTF-8''{quote(route[1])}")
+            if byte_range:
+                self.send_header('Content-Range', f'bytes {first}-{last}/{size}')
+            self.end_headers()
+            if send_body and size:
+                # The kernel copies the file straight to the socket
+                self.connection.sendfile(file, first, last - first + 1)
+
+    def do_PUT(self):
+        route = self._route('uploads')
+        if route is None:
+            self._send_json(404, {'error': "Unknown upload."})
+            return
+        token, name = route
+        length = int(self.headers.get('Content-Length') or 0)
+        content_range = self.headers.get('Content-Range')
+        if content_range:
+            match = _CONTENT_RANGE.match(content_range.strip())
+            if not match:
+                self._send_json(400, {'error': "Malformed Content-Range."})
+                return
+            first, last, total = (int(value) for value in match.groups())
+            if last - first + 1 != length:
+                self._send_json(400, {'error': "Content-Range does not match Content-Length."})
+                return
+        else:
+            first, last, total = 0, length - 1, length
+        if total > self.max_bytes:
+            self._send_json(413, {'error': f"Uploads are limited to {self.max_bytes // (1024 * 1024)} MB."})
+            return
+
+        if not is_reserved(token, self.root):
+            self._send_json(404, {'error': "Unknown upload."})
+            return
+        if os.path.exists(os.path.join(self.root, token, MANIFEST_NAME)):
+            # The upload may already be processed, and its results written next to it
+            self._send_json(409, {'error': "A video was already uploaded here; use \"Upload a different video\" to send another.",
+                                  'code': 'complete'})
+            return
+
+        with self.spools_lock:
+            spool = self.spools.get(token)
+            if first == 0:
+                purge_expired_uploads(self.root)
+                if spool is not None:
+                    spool.abort()
+                    self.spools.pop(token)
+                # Uploads abandoned until their directory expired no longer hold a share of the quota
+                for other in [other for other in self.spools.values() if not os.path.isdir(other.directory)]:
+                    self.spools.pop(other.token).abort()
+                try:
+                    pending = sum(max(0, other.expected_size - other.size) for other in self.spools.values())
+                    check_quota(total, self.root, self.quota_bytes, pending)
+                except UploadError as e:
+                    self._send_json(507, {'error': str(e)})
+                    return
+                try:
+                    spool = UploadSpool(token, name, self.root, self.max_bytes, expected_size=total)
+                except UploadError as e:
+                    self._send_json(400, {'error': str(e)})
+                    return
+                self.spools[token] = spool
+        if spool is None:
+            self._send_json(409, {'error': "Start the upload at byte 0.", 'received': 0})
+            return
+
+        try:
+            remaining = length
+            offset = first
+            while remaining:
+                data = self.rfile.read(min(_READ_BYTES, remaining))
+                if not data:
+                    raise UploadError("The connection closed before the chunk was complete.")
+                spool.write(data, offset)
+                offset = None
+                remaining -= len(data)
+        except UploadError as e:
+            self._send_json(409, {'error': str(e), 'received': spool.size})
+            return
+
+        if spool.size < total:
+            self._send_json(202, {'received': spool.size})
+            return
+        with self.spools_lock:
+            self.spools.pop(token, None)
+        self._send_json(200, {**spool.finish(), 'received': spool.size})
+
+
+class FileServer:
+    """ Serves downloads and accepts chunked uploads from a daemon thread """
+
+    def __init__(self, port, host=FILES_HOST, root=UPLOAD_DIR, max_bytes=MAX_UPLOAD_MB * 1024 * 1024,
+                 quota_bytes=UPLOAD_QUOTA_MB * 1024 * 1024, cors_origin=FILES_CORS_ORIGIN):
+        handler = type('Handler', (_Handler,), {
+            'root': root, 'max_bytes': max_bytes, 'quota_bytes': quota_bytes, 'cors_origin': cors_origin,
+            'spools': {}, 'spools_lock': threading.Lock(),
+        })
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    def serve(self):
+        threading.Thread(target=self.server.serve_forever, name='file-server', daemon=True).start()
+        logger.info(f"Serving files from {self.root} on port {self.port}")
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def get_file_server():
+    """ Return the process-wide file server, starting it on first use, or None if it is disabled or cannot start """
+    global _server
+    with _server_lock:
+        if _server is None and FILES_PORT:
+            try:
+                _server = FileServer(int(FILES_PORT)).serve()
+            except OSError as e:
+                # Another process (e.g. a second Streamlit worker) already serves this port
+                logger.error(f"Could not serve files on port {FILES_PORT}: {e}")
+        return _server
+
+
+def _upload_route(path, root=UPLOAD_DIR):
+    """ Return the (token, name) under which the file server serves `path`, or None """
+    directory, name = os.path.split(os.path.abspath(path))
+    token = os.path.basename(directory)
+    if os.path.dirname(directory) != os.path.abspath(root) or not is_upload_token(token):
+        return None
+    return (token, name) if safe_filename(name) == name else None
+
+
+def download_url(path):
+    """
+    Return the file server's URL for a finished video, so the browser downloads it straight
+    from disk, or None if the file server is not running or does not serve the file.
+    """
+    route = _upload_route(path)
+    if route is None or not FILES_URL or get_file_server() is None:
+        return None
+    return f"{FILES_URL.rstrip('/')}/files/{route[0]}/{quote(route[1])}"
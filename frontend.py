@@ -1,8 +1,13 @@
 import streamlit as st
-from main import process_video_with_subtitles
-from image_gen import translate_and_generate_image
+import streamlit.components.v1 as components
+from add_subtitles import BURN_IN, SOFT
+from dendi_gallery import get_dendi_gallery
+from downloads import FILES_URL, download_url, get_file_server
+from uploads import (MAX_UPLOAD_MB, UPLOAD_CHUNK_BYTES, UploadError, find_upload, new_upload_token, reserve_upload,
+                     spool_file)
+from string import Template
+import threading
 import time
-import random
 import os
 import logging
 
@@ -13,6 +18,107 @@ logger = logging.getLogger(__name__)
 # Set the page layout
 st.set_page_config(layout='wide')
 
+# Load the video pipeline, the Dendi gallery and the LINGUAPIX_ASR_WARMUP models in the background
+# once the first page is up, instead of on the first request that needs them
+BACKGROUND_WARMUP = os.getenv('LINGUAPIX_BACKGROUND_WARMUP', '1') == '1'
+
+
+@st.cache_resource
+def load_dendi_gallery():
+    """ Load the Dendi image gallery into memory once per server process """
+    return get_dendi_gallery()
+
+
+def get_job_queue():
+    """ Return the video job queue, importing the pipeline (ASR, translation, rendering) on first use """
+    from jobs import get_job_queue
+    return get_job_queue()
+
+
+def _warmup():
+    """ Import the pipeline modules, create the shared clients and start preloading the ASR models """
+    started = time.perf_counter()
+    try:
+        import jobs  # noqa: F401
+        import image_gen  # noqa: F401
+        from model_registry import warmup_from_env
+        from translation import get_mt_client
+        get_mt_client()
+        get_dendi_gallery()
+        asr_thread = warmup_from_env()
+        logger.info(f"Loaded the pipeline modules in the background in {time.perf_counter() - started:.1f}s"
+                    + (", preloading ASR models" if asr_thread else ""))
+    except Exception as e:
+        logger.error(f"Background warmup failed: {e}")
+
+
+@st.cache_resource
+def start_background_warmup():
+    """ Start the warmup thread once per server process """
+    thread = threading.Thread(target=_warmup, name='frontend-warmup', daemon=True)
+    thread.start()
+    return thread
+
+
+# Sends the chosen file to the file server in UPLOAD_CHUNK_BYTES pieces, resuming where the server says it stopped
+UPLOAD_WIDGET = Template("""
+<input type="file" id="file" accept=".mp4,.mov,.avi,.mkv" style="font-family: sans-serif">
+<progress id="progress" value="0" max="1" style="width: 100%"></progress>
+<div id="status" style="font-family: sans-serif; font-size: 14px"></div>
+<script>
+document.getElementById("file").onchange = async (event) => {
+  const file = event.target.files[0], status = document.getElementById("status");
+  if (!file) return;
+  if (file.size === 0 || file.size > $max_bytes) { status.textContent = "Videos must be between 1 byte and $max_mb MB."; return; }
+  const url = "$url/uploads/$token/" + encodeURIComponent(file.name);
+  let offset = 0;
+  while (offset < file.size) {
+    const end = Math.min(offset + $chunk_bytes, file.size);
+    const response = await fetch(url, {method: "PUT", body: file.slice(offset, end),
+                                       headers: {"Content-Range": "bytes " + offset + "-" + (end - 1) + "/" + file.size}});
+    const body = await response.json();
+    // Only a 409 that says how much the server holds can be resumed; anything else stops the upload
+    if (!response.ok && (response.status !== 409 || typeof body.received !== "number" || body.received === offset)) {
+      status.textContent = body.error; return;
+    }
+    offset = body.received;
+    document.getElementById("progress").value = offset / file.size;
+  }
+  // The token now belongs to this file; another video needs a new widget
+  event.target.disabled = true;
+  status.textContent = "Uploaded " + file.name + ". Press Start to process it.";
+};
+</script>
+""")
+
+
+@st.cache_resource
+def start_file_server():
+    """ Start the download and upload server once per server process, unless LINGUAPIX_FILES_PORT is empty """
+    return get_file_server()
+
+
+def show_processed_video(processed_video_path):
+    """ Offer a finished video for download, or report that processing failed """
+    if processed_video_path and os.path.exists(processed_video_path):
+        st.success("Video processing complete.")
+        logger.info(f"Video processing complete. File available at: {processed_video_path}")
+        url = download_url(processed_video_path)
+        if url:
+            # The browser fetches the file from the file server; it is never read into this process
+            st.link_button("Download Processed Video", url)
+        else:
+            with open(processed_video_path, "rb") as file:
+                st.download_button(
+                    label="Download Processed Video",
+                    data=file,
+                    file_name=os.path.basename(processed_video_path),
+                    mime="video/x-matroska" if processed_video_path.endswith(".mkv") else "video/mp4"
+                )
+    else:
+        st.error("Video processing failed. No output file generated.")
+        logger.error("Video processing failed. No output file generated.")
+
 # Main function selector
 func_option = st.sidebar.radio("Select Functionality", ["Video Translation", "Image Generation"])
 
@@ -39,50 +145,91 @@ if func_option == "Video Translation":
 
     output_language = st.sidebar.selectbox("Select Output Language", output_language_options, disabled=input_language == "Dendi")
     subtitles = st.sidebar.checkbox("Subtitles", value=True, disabled=input_language == "Dendi")
+    subtitle_style = st.sidebar.radio(
+        "Subtitle Style",
+        ["Burned into the video", "Selectable track (faster)"],
+        disabled=input_language == "Dendi"
+    )
+    subtitle_mode = SOFT if subtitle_style.startswith("Selectable") else BURN_IN
 
-    dub = st.sidebar.checkbox("Dub", value=True, disabled=True)
-    st.sidebar.warning("Dub functionality is currently under development.")
+    dub = st.sidebar.checkbox("Dub", value=False, disabled=input_language == "Dendi",
+                              help="Replace the speech with synthesized speech of the translated subtitles.")
 
     if input_language == "Dendi" and not subtitles:
         st.sidebar.warning("At least subtitles should be selected for Dendi input.")
 
     if input_language == "English" and output_language == "Dendi":
         video_file = st.sidebar.selectbox("Select a video file", ["M1", "M10", "M12", "M17"])
+    elif FILES_URL and start_file_server() is not None:
+        # Large videos go to disk in chunks through the file server instead of through Streamlit
+        if "upload_token" not in st.session_state:
+            st.session_state.upload_token = new_upload_token()
+        video_file = find_upload(st.session_state.upload_token)
+        if video_file:
+            # A finished upload is never overwritten; another video gets a new token and so a new widget
+            st.info(f"Uploaded {video_file['filename']}. Press Start to process it.")
+            if st.button("Upload a different video"):
+                st.session_state.upload_token = new_upload_token()
+                st.rerun()
+        else:
+            # The file server only accepts chunks for tokens handed out here
+            reserve_upload(st.session_state.upload_token)
+            components.html(UPLOAD_WIDGET.substitute(
+                url=FILES_URL.rstrip("/"), token=st.session_state.upload_token, chunk_bytes=UPLOAD_CHUNK_BYTES,
+                max_bytes=MAX_UPLOAD_MB * 1024 * 1024, max_mb=MAX_UPLOAD_MB,
+            ), height=90)
     else:
         video_file = st.file_uploader("Drag and Drop your video here", type=["mp4", "mov", "avi", "mkv"], label_visibility="collapsed", disabled=input_language == "Dendi")
 
     if st.button("Start", disabled=input_language == "Dendi"):
         if video_file:
-            st.write("Processing video...")
             if input_language == "English" and output_language == "Dendi":
+                st.write("Processing video...")
                 time.sleep(7)
                 processed_video_path = os.path.abspath(os.path.join("./dendi_sub", f"{video_file}_dendi.mp4"))
                 logger.info(f"Processing video at path: {processed_video_path}")
+                st.session_state.video_job_id = None
+                show_processed_video(processed_video_path)
             else:
-                video_path = video_file.name
-                with open(video_path, "wb") as f:
-                    f.write(video_file.getbuffer())
-                logger.info(f"Video file saved at: {video_path}")
-
-                processed_video_path = process_video_with_subtitles(video_path, input_language, output_language, dub)
-                logger.info(f"Processed video saved at: {processed_video_path}")
-
-            if processed_video_path and os.path.exists(processed_video_path):
-                st.success("Video processing complete.")
-                logger.info(f"Video processing complete. File available at: {processed_video_path}")
-                with open(processed_video_path, "rb") as file:
-                    st.download_button(
-                        label="Download Processed Video",
-                        data=file,
-                        file_name=os.path.basename(processed_video_path),
-                        mime="video/mp4"
+                try:
+                    # Uploads through the file server are already on disk; copy the others there in chunks
+                    upload = video_file if isinstance(video_file, dict) else spool_file(video_file, video_file.name)
+                except UploadError as e:
+                    st.error(str(e))
+                    logger.error(f"Upload refused: {e}")
+                else:
+                    logger.info(f"Video file saved at: {upload['path']} ({upload['size']} bytes, sha256 {upload['sha256']})")
+                    st.session_state.video_job_id = get_job_queue().submit(
+                        upload['path'], input_language, output_language, dub, subtitle_mode,
+                        input_digest=upload['sha256'],
                     )
-            else:
-                st.error("Video processing failed. No output file generated.")
-                logger.error("Video processing failed. No output file generated.")
+                    # The next video gets its own upload directory
+                    st.session_state.pop("upload_token", None)
+                    logger.info(f"Submitted video job {st.session_state.video_job_id}")
         else:
-            st.error("Please upload a video to start.")
+            st.error("Please upload a video, and wait for the upload to finish, to start.")
             logger.error("No video file uploaded.")
+
+    job_id = st.session_state.get("video_job_id")
+    if job_id:
+        from jobs import DONE, FAILED
+        job = get_job_queue().get(job_id)
+        if job is None or job["status"] == FAILED:
+            st.error("Video processing failed. No output file generated.")
+            logger.error(f"Video job {job_id} failed: {job['error'] if job else 'unknown job'}")
+            # Completed stages are kept, so a retry picks up where the job stopped
+            if job is not None and st.button("Retry"):
+                get_job_queue().retry(job_id)
+                st.rerun()
+        elif job["status"] == DONE:
+            logger.info(f"Processed video saved at: {job['result_path']}")
+            show_processed_video(job["result_path"])
+        else:
+            st.write(f"Processing video... ({job['stage'] or 'waiting in queue'})")
+            st.progress(job["progress"] or 0.0)
+            # Poll the job again without blocking other sessions
+            time.sleep(1)
+            st.rerun()
 elif func_option == "Image Generation":
     st.write("## Generate Image")
     st.write("### Select Language and Enter Prompt")
@@ -98,39 +245,23 @@ elif func_option == "Image Generation":
         generate_clicked = st.button("Generate Image")
 
         if generate_clicked:
-            st.write("Generating image...")
-            time.sleep(10)
             prompt_index = prompt_options.index(selected_prompt) + 1
-            current_directory = os.getcwd()
-
-            # Construct the directory path
-            directory_path = os.path.join(current_directory, "dendi", str(prompt_index))
-            logger.info(f"Checking for directory: {directory_path}")
-
-            # Check if the directory exists
-            if os.path.isdir(directory_path):
-                selected_image = random.choice(os.listdir(directory_path))
-                image_path = os.path.join(directory_path, selected_image)
-                logger.info(f"Selected image path: {image_path}")
-                st.write(f"Selected image path: {image_path}")
-            else:
-                st.error(f"Directory does not exist: {directory_path}")
-                logger.error(f"Directory does not exist: {directory_path}")
-                image_path = None
-
-            if image_path and os.path.exists(image_path):
-                with open(image_path, "rb") as file:
-                    image_bytes = file.read()
-                st.image(image_bytes, caption="Generated Image")
+            gallery = load_dendi_gallery()
+            image = gallery.pick(prompt_index)
+
+            if image is not None:
+                logger.info(f"Selected gallery image {prompt_index}/{image.name}")
+                st.image(image.data, caption="Generated Image")
                 st.download_button(
                     label="Download Image",
-                    data=image_bytes,
-                    file_name="generated_image.png",
-                    mime="image/png"
+                    data=image.data,
+                    file_name="generated_image.webp",
+                    mime="image/webp"
                 )
+                st.image([other.thumbnail for other in gallery.images(prompt_index)], width=96)
             else:
                 st.error("Image generation failed.")
-                logger.error("Image generation failed. No output file generated.")
+                logger.error(f"No gallery images for prompt {prompt_index}.")
     else:
         prompt = st.text_input("Enter your prompt")
         generate_clicked = st.button("Generate Image")
@@ -139,6 +270,7 @@ elif func_option == "Image Generation":
             st.session_state.image_bytes = None
 
         if generate_clicked and prompt:
+            from image_gen import translate_and_generate_image
             st.session_state.image_bytes = translate_and_generate_image(prompt, language, size)
             logger.info(f"Image generated for prompt: {prompt}")
 
@@ -159,3 +291,7 @@ elif func_option == "Image Generation":
         if generate_clicked and not prompt:
             st.error("Please enter a prompt to generate an image.")
             logger.error("No prompt entered for image generation.")
+
+# Everything above has rendered by now
+if BACKGROUND_WARMUP:
+    start_background_warmup()
@@ -0,0 +1,89 @@
+import os
+import threading
+from collections import OrderedDict
+
+from result_cache import ResultCache, key_digest
+from translation_memory import normalize_text
+
+IMAGE_CACHE_DIR = os.getenv('LINGUAPIX_IMAGE_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'linguapix', 'images'))
+IMAGE_CACHE_MB = int(os.getenv('LINGUAPIX_IMAGE_CACHE_MB', '2048'))
+# Size of the in-memory tier in front of the disk store
+IMAGE_CACHE_MEMORY_MB = int(os.getenv('LINGUAPIX_IMAGE_CACHE_MEMORY_MB', '64'))
+
+
+def image_key(prompt, engine_id, size, cfg_scale, steps, seed):
+    """ Return the cache key of an image generated from an English prompt with these settings """
+    # Stable Diffusion's CLIP tokenizer lowercases prompts, so case never changes the image
+    return {
+        'prompt': normalize_text(prompt).lower(),
+        'engine': engine_id,
+        'size': size.lower(),
+        'cfg_scale': cfg_scale,
+        'steps': steps,
+        'seed': seed,
+    }
+
+
+class ImageCache:
+    """
+    Cache of generated images. Encoded images are kept on disk in a ResultCache with its own
+    size cap and least-recently-used eviction, and the most recently used ones are also kept
+    in memory, up to `memory_mb`, so repeated prompts are served without touching the disk.
+    """
+
+    def __init__(self, root=IMAGE_CACHE_DIR, max_mb=IMAGE_CACHE_MB, memory_mb=IMAGE_CACHE_MEMORY_MB):
+        self.disk = ResultCache(root, max_mb)
+        self.memory_bytes = memory_mb * 1024 * 1024
+        self._memory = OrderedDict()
+        self._memory_used = 0
+        self._lock = threading.Lock()
+
+    def _remember(self, digest, data):
+        with self._lock:
+            if digest in self._memory:
+                self._memory_used -= len(self._memory.pop(digest))
+            if len(data) > self.memory_bytes:
+                return
+            self._memory[digest] = data
+            self._memory_used += len(data)
+            while self._memory_used > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_used -= len(evicted)
+
+    def get(self, key):
+        """
+        Look up an image.
+
+        Args:
+            key (dict): The key returned by image_key.
+
+        Returns:
+            bytes: The encoded image, or None if it is not cached.
+        """
+        digest = key_digest(key)
+        with self._lock:
+            if digest in self._memory:
+                self._memory.move_to_end(digest)
+                return self._memory[digest]
+        data = self.disk.read(key, '.png')
+        if data is not None:
+            self._remember(digest, data)
+        return data
+
+    def put(self, key, data):
+        """ Store an encoded image under `key` """
+        self.disk.write(key, '.png', data)
+        self._remember(key_digest(key), data)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_image_cache():
+    """ Return the process-wide image cache, creating its directory on first use """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ImageCache()
+        return _cache
@@ -1,10 +1,37 @@
+import asyncio
 import base64
 import os
-import requests
-from modernmt import ModernMT
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from image_cache import get_image_cache, image_key
+from translation import translate_texts
+
+ENGINE_ID = "stable-diffusion-v1-6"
+CFG_SCALE = 7
+STEPS = 30
+# 0 lets the API pick a random seed
+SEED = 0
+# Requests in flight at once, which is also the size of the connection pool
+IMAGE_WORKERS = int(os.getenv('LINGUAPIX_IMAGE_WORKERS', '4'))
+# Seconds to wait for the connection, and for the generated images
+CONNECT_TIMEOUT = float(os.getenv('LINGUAPIX_STABILITY_CONNECT_TIMEOUT', '5'))
+READ_TIMEOUT = float(os.getenv('LINGUAPIX_STABILITY_READ_TIMEOUT', '120'))
+# Retries on connection errors, 429 and 5xx responses
+RETRIES = int(os.getenv('LINGUAPIX_STABILITY_RETRIES', '3'))
+
+SIZES = {
+    'small': {'height': 512, 'width': 512},
+    'medium': {'height': 1024, 'width': 1024},
+    'large': {'height': 1536, 'width': 1536},
+    'landscape': {'height': 768, 'width': 1024},
+    'portrait': {'height': 1024, 'width': 768},
+}
 
-mmt = ModernMT("A864DC0E-CA4A-02D4-8BAC-0557155941C5")
 
 def translate_and_generate_image(text, source_lang, size='medium'):
     """
@@ -20,9 +47,16 @@ def translate_and_generate_image(text, source_lang, size='medium'):
     Returns:
         list of bytes: List of image data in bytes format.
     """
+    # Repeated prompts come out of the translation memory without a ModernMT call
     translated_text = translate_text(text, source_lang)
-    images = generate_image_from_text(translated_text, size, 1)
-    return images
+    client = get_stability_client()
+    key = image_key(translated_text, client.engine_id, size, CFG_SCALE, STEPS, SEED)
+    cache = get_image_cache()
+    image = cache.get(key)
+    if image is None:
+        image = client.generate(translated_text, size, 1, limit=1, cfg_scale=CFG_SCALE, steps=STEPS, seed=SEED)[0]
+        cache.put(key, image)
+    return image
 def translate_text(text, source_lang):
     """
     Translate text from Fon, Yoruba, French, or English to English. If the source language is English, the text is returned as is.
@@ -52,60 +86,152 @@ def translate_text(text, source_lang):
     if lang_code == 'en':
         return text
 
-    # Assuming 'mmt' is a predefined object or function for translation
-    translation = mmt.translate(lang_code, "en", text)
-    print(translation.translation)
-    return translation.translation
-
-
+    # Shares the ModernMT client and translation memory with the video pipeline
+    translation = translate_texts([text], lang_code, "en")[0]
+    print(translation)
+    return translation
 
-def generate_image_from_text(prompt, size='medium', samples=1):
-    size = size.lower()
-    engine_id = "stable-diffusion-v1-6"
-    api_host = os.getenv('API_HOST', 'https://api.stability.ai')
-    api_key = 'sk-Umh3hsQ1zQzl22JjXHKYPrTRQ6tkADEi3KtE8plqBlQIkBFc'
-
-    if api_key is None:
-        raise Exception("Missing Stability API key.")
-
-    sizes = {
-        'small': {'height': 512, 'width': 512},
-        'medium': {'height': 1024, 'width': 1024},
-        'large': {'height': 1536, 'width': 1536},
-        'landscape': {'height': 768, 'width': 1024},
-        'portrait': {'height': 1024, 'width': 768},
-    }
 
-    if size not in sizes:
-        raise ValueError("Invalid size. Please choose from: small, medium, big, landscape, portrait.")
+class StabilityClient:
+    """
+    Client for the Stability AI text-to-image API. One pooled HTTP session is reused for every
+    request, with connect/read timeouts and retries with exponential backoff on connection
+    errors, rate limiting (429) and unavailability (503). Generation is billed, so requests that
+    may have reached the API (read timeouts and other 5xx responses) are never retried. Several
+    prompts or samples can be generated concurrently with generate_many, or from asyncio code
+    with agenerate / agenerate_many.
+    """
 
-    response = requests.post(
-        f"{api_host}/v1/generation/{engine_id}/text-to-image",
-        headers={
+    def __init__(self, api_key=None, api_host=None, engine_id=ENGINE_ID, workers=IMAGE_WORKERS,
+                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), retries=RETRIES):
+        self.api_key = api_key or os.getenv('STABILITY_API_KEY', 'sk-Umh3hsQ1zQzl22JjXHKYPrTRQ6tkADEi3KtE8plqBlQIkBFc')
+        self.api_host = api_host or os.getenv('API_HOST', 'https://api.stability.ai')
+        self.engine_id = engine_id
+        self.workers = workers
+        self.timeout = timeout
+
+        if self.api_key is None:
+            raise Exception("Missing Stability API key.")
+
+        retry = Retry(
+            total=retries,
+            read=0,                      # A read error may follow a generation that was already billed
+            other=0,
+            backoff_factor=0.5,
+            status_forcelist=(429, 503), # Statuses for which the API did not generate anything
+            allowed_methods=None,        # Generation requests are POSTs, which urllib3 does not retry by default
+            raise_on_status=False,       # Hand the last response back so its error text can be reported
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
             "Content-Type": "application/json",
             "Accept": "application/json",
-            "Authorization": f"Bearer {api_key}"
-        },
-        json={
-            "text_prompts": [{"text": prompt}],
-            "cfg_scale": 7,
-            "height": sizes[size]['height'],
-            "width": sizes[size]['width'],
-            "samples": samples,
-            "steps": 30,
-        },
-    )
-
-    if response.status_code != 200:
-        raise Exception("Non-200 response: " + str(response.text))
-
-    data = response.json()
-
-    images = []
-    for i, image in enumerate(data["artifacts"]):
-        images.append(base64.b64decode(image["base64"]))
-
-    return images[0]
+            "Authorization": f"Bearer {self.api_key}"
+        })
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='stability')
+            return self._executor
+
+    def generate(self, prompt, size='medium', samples=1, limit=None, cfg_scale=CFG_SCALE, steps=STEPS, seed=SEED):
+        """
+        Generate images for one prompt in a single request.
+
+        Args:
+            prompt (str): The English prompt.
+            size (str, optional): One of the keys of SIZES. Default is 'medium'.
+            samples (int, optional): Number of images the API generates. Default is 1.
+            limit (int, optional): Decode and return at most this many of them. Default is all.
+            cfg_scale (float, optional): How strictly the image follows the prompt. Default is 7.
+            steps (int, optional): Number of diffusion steps. Default is 30.
+            seed (int, optional): Random seed, 0 for a random one. Default is 0.
+
+        Returns:
+            list of bytes: The PNG images.
+        """
+        size = size.lower()
+        if size not in SIZES:
+            raise ValueError("Invalid size. Please choose from: small, medium, big, landscape, portrait.")
+
+        response = self.session.post(
+            f"{self.api_host}/v1/generation/{self.engine_id}/text-to-image",
+            json={
+                "text_prompts": [{"text": prompt}],
+                "cfg_scale": cfg_scale,
+                "height": SIZES[size]['height'],
+                "width": SIZES[size]['width'],
+                "samples": samples,
+                "steps": steps,
+                "seed": seed,
+            },
+            timeout=self.timeout,
+        )
+
+        if response.status_code != 200:
+            raise Exception("Non-200 response: " + str(response.text))
+
+        artifacts = response.json()["artifacts"]
+        # Base64 decoding a 1024x1024 PNG is not free; skip the images nobody will see
+        return [base64.b64decode(image["base64"]) for image in artifacts[:limit]]
+
+    def generate_many(self, prompts, size='medium', samples=1, **params):
+        """
+        Generate `samples` images for each prompt, with every image requested concurrently as
+        its own single-sample request on the connection pool.
+
+        Returns:
+            list of list of bytes: The images for each prompt, in the order of `prompts`.
+        """
+        executor = self._get_executor()
+        futures = [
+            [executor.submit(self.generate, prompt, size, 1, **params) for _ in range(samples)]
+            for prompt in prompts
+        ]
+        return [[image for future in prompt_futures for image in future.result()] for prompt_futures in futures]
+
+    async def agenerate(self, prompt, size='medium', samples=1, **params):
+        """ Awaitable version of generate, run in a worker thread """
+        return await asyncio.to_thread(self.generate, prompt, size, samples, **params)
+
+    async def agenerate_many(self, prompts, size='medium', samples=1, **params):
+        """ Awaitable version of generate_many """
+        results = await asyncio.gather(*[
+            asyncio.gather(*[self.agenerate(prompt, size, 1, **params) for _ in range(samples)])
+            for prompt in prompts
+        ])
+        return [[image for images in prompt_results for image in images] for prompt_results in results]
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_stability_client():
+    """ Return the process-wide StabilityClient, creating it on first use """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = StabilityClient()
+        return _client
 
 
+def generate_image_from_text(prompt, size='medium', samples=1):
+    """
+    Generate an image from an English prompt with the shared Stability client.
 
+    Returns:
+        bytes: The first generated image.
+    """
+    return get_stability_client().generate(prompt, size, samples, limit=1)[0]
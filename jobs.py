@@ -0,0 +1,178 @@
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from add_subtitles import BURN_IN
+from main import process_video_with_subtitles
+
+JOBS_DB = os.getenv('LINGUAPIX_JOBS_DB', os.path.join(os.path.expanduser('~'), '.cache', 'linguapix', 'jobs.sqlite3'))
+# Number of videos processed at the same time by one server process
+JOB_WORKERS = int(os.getenv('LINGUAPIX_JOB_WORKERS', '2'))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+logger = logging.getLogger(__name__)
+
+
+def _owner_alive(owner):
+    """ Return whether the process named by a job's owner column ('<host>:<pid>') may still be running """
+    host, _, pid = (owner or '').rpartition(':')
+    if host != socket.gethostname():
+        # Processes on other machines sharing the database cannot be checked from here
+        return bool(owner)
+    if not pid.isdigit() or int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobQueue:
+    """
+    Runs video pipeline jobs on a bounded pool of worker threads. Job state and progress
+    are stored in SQLite so any Streamlit session can poll a job by id. Each job records the
+    process that runs it, so several server processes can share one database.
+    """
+
+    def __init__(self, db_path=JOBS_DB, workers=JOB_WORKERS):
+        self.db_path = db_path
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        if db_path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='video-job')
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, status TEXT, stage TEXT, progress REAL,"
+                " video_path TEXT, input_lang TEXT, output_lang TEXT, dub INTEGER,"
+                " result_path TEXT, error TEXT, created REAL, updated REAL, subtitle_mode TEXT, owner TEXT,"
+                " input_sha256 TEXT)"
+            )
+            # Databases created before subtitle modes, job owners or upload digests existed lack the columns
+            columns = [row['name'] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+            for column in ('subtitle_mode', 'owner', 'input_sha256'):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+            # Jobs whose process has stopped will never finish; other live processes keep theirs
+            rows = self._conn.execute(
+                "SELECT id, owner FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING),
+            ).fetchall()
+            orphaned = [row['id'] for row in rows if not _owner_alive(row['owner'])]
+            self._conn.executemany(
+                "UPDATE jobs SET status = ?, error = ?, updated = ? WHERE id = ?",
+                [(FAILED, 'Interrupted by a server restart', time.time(), job_id) for job_id in orphaned],
+            )
+            self._conn.commit()
+
+    def _update(self, job_id, **fields):
+        fields['updated'] = time.time()
+        columns = ', '.join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", [*fields.values(), job_id])
+            self._conn.commit()
+
+    def submit(self, video_path, input_lang, output_lang, dub=False, subtitle_mode=BURN_IN, input_digest=None):
+        """
+        Queue a video for processing.
+
+        Args:
+            video_path (str): Path to the uploaded video.
+            input_lang (str): Spoken language of the video.
+            output_lang (str): Language of the subtitles.
+            dub (bool, optional): Whether to dub the video. Default is False.
+            subtitle_mode (str, optional): 'burn' or 'soft'. Default is 'burn'.
+            input_digest (str, optional): SHA-256 hex digest of the video, as computed while it
+                was uploaded, so the pipeline need not read it again to key its cache.
+
+        Returns:
+            str: The id of the new job.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, stage, progress, video_path, input_lang, output_lang, dub, subtitle_mode,"
+                " owner, input_sha256, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, None, 0.0, video_path, input_lang, output_lang, int(dub), subtitle_mode, self.owner,
+                 input_digest, now, now),
+            )
+            self._conn.commit()
+        self._executor.submit(self._run, job_id, video_path, input_lang, output_lang, dub, subtitle_mode, input_digest)
+        logger.info(f"Queued job {job_id} for {video_path}")
+        return job_id
+
+    def _run(self, job_id, video_path, input_lang, output_lang, dub, subtitle_mode, input_digest):
+        self._update(job_id, status=RUNNING)
+        stage = {'name': None}
+
+        def progress(name, fraction):
+            stage['name'] = name
+            self._update(job_id, stage=name, progress=fraction)
+
+        try:
+            result_path = process_video_with_subtitles(video_path, input_lang, output_lang, dub, progress=progress,
+                                                       subtitle_mode=subtitle_mode, job_id=job_id,
+                                                       input_digest=input_digest)
+        except Exception as e:
+            logger.error(f"Job {job_id} crashed: {e}")
+            result_path = None
+        if result_path:
+            self._update(job_id, status=DONE, progress=1.0, result_path=result_path)
+        else:
+            self._update(job_id, status=FAILED, error=f"Processing failed during the {stage['name']} stage")
+
+    def retry(self, job_id):
+        """
+        Run a failed job again under the same id, so the pipeline resumes from the last
+        stage that completed in the job's work directory.
+
+        Returns:
+            bool: True if the job was requeued.
+        """
+        job = self.get(job_id)
+        if job is None or job['status'] != FAILED:
+            return False
+        self._update(job_id, status=QUEUED, error=None, owner=self.owner)
+        self._executor.submit(self._run, job_id, job['video_path'], job['input_lang'], job['output_lang'],
+                              bool(job['dub']), job['subtitle_mode'] or BURN_IN, job['input_sha256'])
+        logger.info(f"Requeued job {job_id}")
+        return True
+
+    def get(self, job_id):
+        """
+        Look up a job.
+
+        Returns:
+            dict: The job's columns, or None if there is no such job.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """ Return the process-wide job queue, starting it on first use """
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+        return _queue
@@ -0,0 +1,170 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from audio import SAMPLE_RATE
+from metrics import stage
+from model_registry import get_registry
+
+# Audio longer than this is split at silences and transcribed in parallel
+LONG_AUDIO_SECONDS = float(os.getenv('LINGUAPIX_LONG_AUDIO_SECONDS', '600'))
+# Every worker holds its own copy of the model, so this is bounded by memory as much as by cores
+ASR_WORKERS = int(os.getenv('LINGUAPIX_ASR_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def split_on_silence(audio, sample_rate=SAMPLE_RATE, max_chunk_seconds=30.0, min_chunk_seconds=10.0,
+                     frame_seconds=0.03, window_seconds=0.3):
+    """
+    Split audio into chunks no longer than `max_chunk_seconds`, cutting each one at the
+    quietest point between `min_chunk_seconds` and `max_chunk_seconds` from its start.
+    Quietness is the mean frame energy over a sliding window of `window_seconds`.
+
+    Args:
+        audio (numpy.ndarray): Mono float32 samples.
+        sample_rate (int, optional): Sample rate of `audio`. Default is 16000.
+        max_chunk_seconds (float, optional): Upper bound on chunk length. Default is 30.
+        min_chunk_seconds (float, optional): Lower bound on chunk length, except for the last chunk. Default is 10.
+        frame_seconds (float, optional): Length of the energy frames. Default is 0.03.
+        window_seconds (float, optional): Length of the smoothing window. Default is 0.3.
+
+    Returns:
+        list of tuple: (start_sample, end_sample) pairs covering the whole input in order.
+    """
+    frame = max(1, int(frame_seconds * sample_rate))
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return [(0, len(audio))] if len(audio) else []
+
+    energy = np.square(audio[:n_frames * frame], dtype=np.float64).reshape(n_frames, frame).mean(axis=1)
+    window = max(1, int(window_seconds / frame_seconds))
+    energy = np.convolve(energy, np.ones(window) / window, mode='same')
+
+    max_frames = max(1, int(max_chunk_seconds / frame_seconds))
+    min_frames = min(max_frames, int(min_chunk_seconds / frame_seconds))
+
+    boundaries = []
+    start = 0
+    while n_frames - start > max_frames:
+        search = energy[start + min_frames:start + max_frames + 1]
+        cut = start + min_frames + int(np.argmin(search))
+        boundaries.append((start * frame, cut * frame))
+        start = max(cut, start + 1)
+    boundaries.append((start * frame, len(audio)))
+    return boundaries
+
+
+def _init_worker(threads):
+    """ Keep each worker's intra-op threads to its share of the cores """
+    # Read by backends that manage their own threads, such as faster-whisper
+    os.environ['LINGUAPIX_ASR_THREADS'] = str(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def _transcribe_segment(model_id, samples, return_timestamps, backend):
+    """ Transcribe one segment in a worker process with that process's shared pipeline """
+    with get_registry().acquire(model_id, backend) as pipe:
+        result = pipe({"raw": samples, "sampling_rate": SAMPLE_RATE}, return_timestamps=return_timestamps)
+    return result.get('chunks', [])
+
+
+def _get_pool():
+    """ Return the process pool, starting it on first use. Workers keep their models loaded between calls """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            threads = max(1, (os.cpu_count() or 1) // ASR_WORKERS)
+            # Forking a process that has already started torch threads can deadlock, so always spawn
+            _pool = ProcessPoolExecutor(max_workers=ASR_WORKERS, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_init_worker, initargs=(threads,))
+        return _pool
+
+
+def _offset_chunks(chunks, start, end):
+    """ Move the chunks of the segment audio[start:end] to their absolute positions, in seconds """
+    offset = start / SAMPLE_RATE
+    segment_end = end / SAMPLE_RATE
+    absolute = []
+    for chunk in chunks:
+        chunk_start, chunk_end = chunk['timestamp']
+        chunk_start = offset + (chunk_start or 0.0)
+        # Whisper leaves the end of a chunk cut off by the segment boundary open
+        chunk_end = segment_end if chunk_end is None else min(offset + chunk_end, segment_end)
+        absolute.append({'text': chunk['text'], 'timestamp': (chunk_start, max(chunk_start, chunk_end))})
+    return absolute
+
+
+def iter_transcribed_segments(audio, model_id, return_timestamps=True, backend=None, parallel=True):
+    """
+    Split audio at silences and transcribe the segments, yielding each segment's chunks in order
+    as soon as they are ready. With `parallel`, segments are transcribed ahead in the process
+    pool; otherwise one at a time in this thread with the shared pipeline.
+
+    Args:
+        audio (numpy.ndarray): Mono float32 samples at 16 kHz.
+        model_id (str): Hugging Face model id of the ASR model.
+        return_timestamps (bool or str, optional): Passed to the ASR pipeline. Default is True.
+        backend (str, optional): Inference backend. Defaults to LINGUAPIX_ASR_BACKEND.
+        parallel (bool, optional): Use the process pool. Default is True.
+
+    Yields:
+        list of dict: The chunks of one segment, with absolute timestamps.
+    """
+    segments = split_on_silence(audio)
+    futures = []
+    if parallel:
+        pool = _get_pool()
+        futures = [
+            pool.submit(_transcribe_segment, model_id, audio[start:end], return_timestamps, backend)
+            for start, end in segments
+        ]
+    try:
+        for i, (start, end) in enumerate(segments):
+            with stage('asr_inference', model=model_id, backend=backend, audio_seconds=(end - start) / SAMPLE_RATE,
+                       chunked=parallel, streaming=True):
+                if parallel:
+                    chunks = futures[i].result()
+                else:
+                    chunks = _transcribe_segment(model_id, audio[start:end], return_timestamps, backend)
+            yield _offset_chunks(chunks, start, end)
+    finally:
+        # The consumer stopped early; drop the segments nobody will read
+        for future in futures:
+            future.cancel()
+
+
+def transcribe_long_audio(audio, model_id, return_timestamps=True, backend=None):
+    """
+    Transcribe long audio by splitting it at silences and transcribing the chunks in a process pool.
+
+    Args:
+        audio (numpy.ndarray): Mono float32 samples at 16 kHz.
+        model_id (str): Hugging Face model id of the ASR model.
+        return_timestamps (bool or str, optional): Passed to the ASR pipeline. Default is True.
+        backend (str, optional): Inference backend. Defaults to LINGUAPIX_ASR_BACKEND.
+
+    Returns:
+        dict: Transcription data in the pipeline's format, with every chunk timestamp
+        already offset to its absolute position in `audio`.
+    """
+    segments = split_on_silence(audio)
+    pool = _get_pool()
+    futures = [
+        pool.submit(_transcribe_segment, model_id, audio[start:end], return_timestamps, backend)
+        for start, end in segments
+    ]
+
+    chunks = []
+    for (start, end), future in zip(segments, futures):
+        chunks.extend(_offset_chunks(future.result(), start, end))
+
+    return {'text': ' '.join(chunk['text'].strip() for chunk in chunks), 'chunks': chunks}
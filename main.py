@@ -1,85 +1,455 @@
 import subprocess
-import time
+import shutil
 import uuid
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
-from add_subtitles import add_subtitles_to_video
-from transcription import transcribe_and_create_srt, transcribe_and_create_srt_fon
-from translation import translate_srt
+from asr_backends import resolve_backend
+from audio import SAMPLE_RATE, extract_audio
+from add_dubbing import dub_video
+from add_subtitles import (BURN_IN, SOFT, SUBTITLE_LANGUAGE_TAGS, SUBTITLE_MODES, burn_subtitles_multi,
+                           mux_subtitle_tracks, mux_subtitles_to_video)
+from metrics import stage
+from parallel_burn import burn_subtitles_parallel
+from result_cache import MT_ENGINE, get_result_cache, hash_file, key_digest
+from streaming import transcribe_and_translate
+from subtitles import read_subtitles
+from transcription import asr_model_for_language, transcribe_to_cues
+from translation import translate_cues
+from tts_backends import TTS_BACKEND
+from workspace import KEEP_FAILED_WORK, Workspace
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 
-def process_video_with_subtitles(video_path, input_lang, output_lang, dub=False):
+# Translate subtitles while the audio is still being transcribed
+STREAMING = os.getenv('LINGUAPIX_STREAMING', '0') == '1'
+
+LANGUAGE_CODES = {'Yoruba': 'yo', 'English': 'en', 'French': 'fr', 'Fon': 'fon', 'Spanish': 'es'}
+
+
+def _output_container(extension, subtitle_mode):
+    """ Return the extension of the rendered video for a source with `extension` """
+    if subtitle_mode == BURN_IN:
+        return '.mp4'
+    # Stream copy needs a container that accepts the source codecs
+    return '.mp4' if extension.lower() in ('.mp4', '.mov') else '.mkv'
+
+
+def _transcript_key(video_path, input_lang, streaming=False, input_digest=None):
+    """ Result cache key of a video's transcript; `input_digest` saves hashing a file whose SHA-256 is known """
+    key = {
+        'input': input_digest or hash_file(video_path),
+        'input_lang': input_lang,
+        'asr_model': asr_model_for_language(input_lang),
+        'asr_backend': resolve_backend(),
+    }
+    if streaming:
+        # Streamed transcripts are split at silences and skip fix_resets, so their cues differ
+        key['segmentation'] = 'streaming'
+    return key
+
+
+def _remove_partial(paths):
+    """ Delete what a failed render left behind """
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _cached_transcript(workspace, cache, transcript_key):
+    """ Return the transcript from the work directory or the result cache, or None if neither has it """
+    srt_path = workspace.path('transcript.srt')
+    if not workspace.done('transcript') and cache.get(transcript_key, '.srt', srt_path):
+        logging.info("Reused cached transcript.")
+        workspace.complete('transcript', ['transcript.srt'], cached=True)
+    if workspace.done('transcript'):
+        return read_subtitles(srt_path)
+    return None
+
+
+def _audio_stage(video_path, report):
+    """
+    Run the audio stage of a job. The samples are not checkpointed: decoding them again on
+    resume is cheap, and they would take twice the space of the WAV file the stage replaced.
+
+    Returns:
+        numpy.ndarray: The audio samples, or None if extraction failed.
+    """
+    # Decode the audio track into memory using ffmpeg
+    report('audio', 0.0)
+    try:
+        logging.info(f"Extracting audio from {video_path}")
+        audio = extract_audio(video_path)
+        logging.info(f"Extracted {len(audio) / SAMPLE_RATE:.1f}s of audio")
+    except subprocess.CalledProcessError as e:
+        logging.error(f"Failed to extract audio: {e}")
+        return None
+    return audio
+
+
+def _save_transcript(cues, workspace, cache, transcript_key):
+    """ Write a fresh transcript for the cache and for resuming, and mark its stage complete """
+    srt_path = workspace.path('transcript.srt')
+    cues.write(srt_path)
+    cache.put(transcript_key, '.srt', srt_path)
+    workspace.complete('transcript', ['transcript.srt'])
+
+
+def _transcribe_stage(video_path, input_lang, workspace, cache, transcript_key, report):
+    """
+    Run the audio and transcript stages of a job, or pick up the transcript from the work
+    directory or the result cache.
+
+    Returns:
+        CueList: The transcript, or None if a stage failed.
+    """
+    cues = _cached_transcript(workspace, cache, transcript_key)
+    if cues is not None:
+        return cues
+    audio = _audio_stage(video_path, report)
+    if audio is None:
+        return None
+
+    report('transcript', 0.1)
+    try:
+        logging.info(f"Transcribing {input_lang} audio...")
+        # The cues stay in memory for translation; the SRT is written for the cache and for resuming
+        cues = transcribe_to_cues(audio, asr_model_for_language(input_lang))
+        _save_transcript(cues, workspace, cache, transcript_key)
+        logging.info(f"Transcription completed with {len(cues)} cues.")
+        return cues
+    except Exception as e:
+        logging.error(f"Failed to transcribe and create SRT: {e}")
+        return None
+
+
+def _streaming_stage(video_path, input_lang, output_lang, workspace, cache, transcript_key, report):
+    """
+    Run the audio stage, then the transcript and translation stages at the same time: cues are
+    translated while the rest of the audio is still being transcribed.
+
+    Returns:
+        CueList: The translated cues, or None if a stage failed.
+    """
+    audio = _audio_stage(video_path, report)
+    if audio is None:
+        return None
+
+    report('transcript', 0.1)
+    try:
+        logging.info(f"Transcribing {input_lang} audio and translating it as it is transcribed...")
+        cues, translated = transcribe_and_translate(
+            audio, asr_model_for_language(input_lang), LANGUAGE_CODES[input_lang], LANGUAGE_CODES[output_lang],
+        )
+        _save_transcript(cues, workspace, cache, transcript_key)
+        logging.info(f"Transcription and translation completed with {len(cues)} cues.")
+        return translated
+    except Exception as e:
+        logging.error(f"Failed to transcribe and translate: {e}")
+        return None
+
+
+def process_video_with_subtitles(video_path, input_lang, output_lang, dub=False, progress=None, subtitle_mode=BURN_IN,
+                                 job_id=None, keep_on_failure=KEEP_FAILED_WORK, streaming=STREAMING, input_digest=None):
+    """
+    Transcribe a video, translate its subtitles and add them to a copy of the video.
+
+    Intermediate files live in a work directory for the job, next to a manifest of the stages
+    (transcript, translation, render, dub) that have completed. Running the same job again
+    after a failure resumes from the last completed stage.
+
+    Args:
+        video_path (str): Path to the uploaded video.
+        input_lang (str): Spoken language of the video, e.g. 'French'.
+        output_lang (str): Language of the subtitles, e.g. 'Yoruba'.
+        dub (bool, optional): Whether to dub the video. Default is False.
+        progress (callable, optional): Called as progress(stage, fraction) when each stage starts.
+        subtitle_mode (str, optional): 'burn' to render the subtitles into the frames, or 'soft' to
+            add them as a selectable track without re-encoding. Default is 'burn'.
+        job_id (str, optional): Names the work directory. Defaults to a digest of the input contents
+            and settings, so retrying the same video with the same settings resumes it. A run
+            started while another holds that directory works in a fresh one.
+        keep_on_failure (bool, optional): Keep the work directory when a stage fails. The work
+            directory is always removed on success.
+        streaming (bool, optional): Translate cues while the rest of the audio is still being
+            transcribed. Defaults to LINGUAPIX_STREAMING.
+        input_digest (str, optional): SHA-256 hex digest of the video, e.g. computed while it was
+            uploaded. Defaults to hashing the file.
+
+    Returns:
+        str: Path of the subtitled video, or None if any stage failed.
+    """
+    report = progress or (lambda stage, fraction: None)
+    if subtitle_mode not in SUBTITLE_MODES:
+        logging.error(f"Unknown subtitle mode {subtitle_mode}, expected one of {SUBTITLE_MODES}")
+        return None
+    workspace = None
+    succeeded = False
     try:
         logging.info("Starting process_video_with_subtitles")
         
         unique_id = uuid.uuid4().hex
         video_path = os.path.abspath(video_path)
-        audio_file_path = video_path.replace('.mp4', '.wav')
-        srt_path = video_path.replace('.mp4', '.srt')
-
-        # Convert mp4 to wav using ffmpeg
-        try:
-            logging.info(f"Extracting audio from {video_path}")
-            subprocess.run(['ffmpeg', '-i', video_path, '-acodec', 'pcm_s16le', '-ar', '16000', audio_file_path], check=True)
-            logging.info(f"Audio extracted to WAV format at {audio_file_path}")
-        except subprocess.CalledProcessError as e:
-            logging.error(f"Failed to extract audio: {e}")
+        base_path, extension = os.path.splitext(video_path)
+        container = _output_container(extension, subtitle_mode)
+        subtitled_video_path = f'{base_path}_subtitled_{output_lang}_{unique_id}{container}'
+
+        if input_lang not in LANGUAGE_CODES:
+            logging.error(f"Transcription for the language {input_lang} is not supported.")
             return None
-        
-        time.sleep(5)
 
-        language_map = {'Yoruba': 'yo', 'English': 'en', 'French': 'fr', 'Fon': 'fon', 'Spanish': 'es'}
-        if input_lang in language_map:
+        # Results are reused for byte-identical uploads with the same settings
+        cache = get_result_cache()
+        transcript_key = _transcript_key(video_path, input_lang, streaming, input_digest)
+        translation_key = {**transcript_key, 'output_lang': output_lang, 'mt': MT_ENGINE}
+        video_key = {**translation_key, 'subtitle_mode': subtitle_mode, 'dub': dub}
+        if dub:
+            video_key['tts_backend'] = TTS_BACKEND
+
+        if cache.get(video_key, container, subtitled_video_path):
+            logging.info(f"Reused cached video for {video_path} at {subtitled_video_path}")
+            report('done', 1.0)
+            succeeded = True
+            return subtitled_video_path
+
+        workspace = Workspace(job_id or key_digest(video_key))
+        logging.info(f"Working in {workspace.root}")
+        translated_srt_path = workspace.path('translation.srt')
+        rendered_path = workspace.path(f'render{container}')
+
+        if not workspace.done('translation') and cache.get(translation_key, '.srt', translated_srt_path):
+            logging.info("Reused cached translation.")
+            workspace.complete('translation', ['translation.srt'], cached=True)
+        # Translate the subtitles
+        translated = None
+        if not workspace.done('translation'):
+            cues = _cached_transcript(workspace, cache, transcript_key)
+            if cues is None and streaming:
+                translated = _streaming_stage(video_path, input_lang, output_lang, workspace, cache, transcript_key,
+                                              report)
+                if translated is None:
+                    return None
+            elif cues is None:
+                cues = _transcribe_stage(video_path, input_lang, workspace, cache, transcript_key, report)
+                if cues is None:
+                    return None
+            report('translation', 0.6)
             try:
-                if input_lang == 'Fon':
-                    logging.info("Transcribing and creating SRT for Fon language...")
-                    transcribe_and_create_srt_fon(audio_file_path)
-                    logging.info("Transcription and SRT creation for Fon language completed.")
-                else:
-                    logging.info(f"Transcribing and creating SRT... with file path: {audio_file_path}")
-                    transcribe_and_create_srt(audio_file_path)
-                    logging.info("Transcription and SRT creation completed.")
+                if translated is None:
+                    logging.info("Translating subtitles...")
+                    translated = translate_cues(cues, LANGUAGE_CODES[input_lang], LANGUAGE_CODES[output_lang])
+                translated.write(translated_srt_path)
+                cache.put(translation_key, '.srt', translated_srt_path)
+                workspace.complete('translation', ['translation.srt'])
+                logging.info("Translation completed.")
             except Exception as e:
-                logging.error(f"Failed to transcribe and create SRT: {e}")
+                logging.error(f"Failed to translate SRT file: {e}")
                 return None
-        else:
-            logging.error(f"Transcription for the language {input_lang} is not supported.")
-            return None
-
-        # Translate the SRT file
-        try:
-            translated_srt_path = srt_path.replace('.srt', f'_{output_lang}.srt')
-            logging.info("Translating SRT file...")
-            translate_srt(srt_path, language_map[input_lang], language_map[output_lang], translated_srt_path)
-            logging.info("Translation completed.")
-        except Exception as e:
-            logging.error(f"Failed to translate SRT file: {e}")
-            return None
 
         # Add subtitles to video
-        try:
-            subtitled_video_path = video_path.replace('.mp4', f'_subtitled_{output_lang}_{unique_id}.mp4')
-            logging.info(f"Adding subtitles to video, saving to {subtitled_video_path}")
-            add_subtitles_to_video(video_path, translated_srt_path, subtitled_video_path)
+        if not workspace.done('render'):
+            report('render', 0.7)
+            try:
+                with stage('render', subtitle_mode=subtitle_mode, source_bytes=os.path.getsize(video_path)) as record:
+                    if subtitle_mode == BURN_IN:
+                        logging.info(f"Adding subtitles to video, saving to {rendered_path}")
+                        # Segments are cut from the cues in memory when they were just translated
+                        subtitles = translated if translated is not None else translated_srt_path
+                        burn_subtitles_parallel(video_path, subtitles, rendered_path)
+                    else:
+                        logging.info(f"Adding subtitle track to video, saving to {rendered_path}")
+                        mux_subtitles_to_video(video_path, translated_srt_path, rendered_path,
+                                               SUBTITLE_LANGUAGE_TAGS.get(LANGUAGE_CODES[output_lang]))
+                    record['output_bytes'] = os.path.getsize(rendered_path)
+            except Exception as e:
+                logging.error(f"Failed to add subtitles to video: {e}")
+                # A partly written render must never be resumed from or cached
+                _remove_partial([rendered_path])
+                return None
+            workspace.complete('render', [os.path.basename(rendered_path)])
             logging.info("Subtitles added to video.")
-        except Exception as e:
-            logging.error(f"Failed to add subtitles to video: {e}")
-            return None
 
+        # Replace the speech with synthesized speech of the translated cues
         if dub:
-            logging.info("Dubbing feature is not implemented yet.")
+            dubbed_path = workspace.path(f'dub{container}')
+            if not workspace.done('dub'):
+                report('dub', 0.85)
+                try:
+                    logging.info(f"Dubbing video, saving to {dubbed_path}")
+                    cues = translated if translated is not None else read_subtitles(translated_srt_path)
+                    # The original audio is decoded again from the render, which carries it unchanged
+                    dub_video(rendered_path, cues, LANGUAGE_CODES[output_lang], dubbed_path,
+                              language_tag=SUBTITLE_LANGUAGE_TAGS.get(LANGUAGE_CODES[output_lang]))
+                except Exception as e:
+                    logging.error(f"Failed to dub video: {e}")
+                    return None
+                workspace.complete('dub', [os.path.basename(dubbed_path)])
+                logging.info("Dubbing completed.")
+            rendered_path = dubbed_path
 
+        cache.put(video_key, container, rendered_path)
+        shutil.move(rendered_path, subtitled_video_path)
         logging.info(f"Processed video with subtitles is available at {subtitled_video_path}")
 
+        report('done', 1.0)
+        succeeded = True
+        return subtitled_video_path
+    except Exception as e:
+        logging.error(f"An unexpected error occurred: {e}")
+        return None
+    finally:
         # Clean up intermediate files
-        os.remove(audio_file_path)
-        os.remove(srt_path)
-        os.remove(translated_srt_path)
+        if workspace is not None and (succeeded or not keep_on_failure):
+            workspace.cleanup()
+        elif workspace is not None:
+            workspace.release()
 
-        return subtitled_video_path
+
+def process_video_multi_language(video_path, input_lang, output_langs, progress=None, subtitle_mode=SOFT,
+                                 job_id=None, keep_on_failure=KEEP_FAILED_WORK, input_digest=None):
+    """
+    Transcribe a video once and subtitle it in several languages.
+
+    The transcript is translated into every language concurrently. In 'soft' mode the result is
+    one video with a subtitle track per language. In 'burn' mode there is one video per
+    language, all encoded by a single ffmpeg process that decodes the source only once.
+
+    Args:
+        video_path (str): Path to the uploaded video.
+        input_lang (str): Spoken language of the video, e.g. 'French'.
+        output_langs (list of str): Languages of the subtitles, e.g. ['Yoruba', 'Fon'].
+        progress (callable, optional): Called as progress(stage, fraction) when each stage starts.
+        subtitle_mode (str, optional): 'soft' for one video with a track per language, or 'burn'
+            for one video per language. Default is 'soft'.
+        job_id (str, optional): Names the work directory. Defaults to a digest of the input
+            contents and settings.
+        keep_on_failure (bool, optional): Keep the work directory when a stage fails.
+        input_digest (str, optional): SHA-256 hex digest of the video. Defaults to hashing the file.
+
+    Returns:
+        dict: Maps each output language to the path of its video (the same path for every
+            language in 'soft' mode), or None if any stage failed.
+    """
+    report = progress or (lambda stage, fraction: None)
+    output_langs = list(dict.fromkeys(output_langs))
+    if subtitle_mode not in SUBTITLE_MODES:
+        logging.error(f"Unknown subtitle mode {subtitle_mode}, expected one of {SUBTITLE_MODES}")
+        return None
+    unsupported = [lang for lang in [input_lang, *output_langs] if lang not in LANGUAGE_CODES]
+    if unsupported or not output_langs:
+        logging.error(f"Unsupported or missing languages: {unsupported or 'no output languages'}")
+        return None
+    workspace = None
+    succeeded = False
+    try:
+        logging.info(f"Starting process_video_multi_language for {', '.join(output_langs)}")
+
+        unique_id = uuid.uuid4().hex
+        video_path = os.path.abspath(video_path)
+        base_path, extension = os.path.splitext(video_path)
+        container = _output_container(extension, subtitle_mode)
+
+        cache = get_result_cache()
+        transcript_key = _transcript_key(video_path, input_lang, input_digest=input_digest)
+        translation_keys = {lang: {**transcript_key, 'output_lang': lang, 'mt': MT_ENGINE} for lang in output_langs}
+
+        # Each render produces one output video: (cache key, final path, subtitle languages)
+        if subtitle_mode == BURN_IN:
+            # A burned-in video is the same as the one a single-language run produces, so they share cache entries
+            renders = {
+                lang: ({**translation_keys[lang], 'subtitle_mode': BURN_IN, 'dub': False},
+                       f'{base_path}_subtitled_{lang}_{unique_id}{container}', [lang])
+                for lang in output_langs
+            }
+        else:
+            renders = {
+                'tracks': ({**transcript_key, 'output_langs': output_langs, 'mt': MT_ENGINE, 'subtitle_mode': SOFT},
+                           f'{base_path}_subtitled_{"_".join(output_langs)}_{unique_id}{container}', output_langs)
+            }
+
+        pending = {}
+        for name, (key, final_path, langs) in renders.items():
+            if cache.get(key, container, final_path):
+                logging.info(f"Reused cached video at {final_path}")
+            else:
+                pending[name] = (key, final_path, langs)
+
+        if pending:
+            workspace = Workspace(job_id or key_digest([key for key, _, _ in renders.values()]))
+            logging.info(f"Working in {workspace.root}")
+
+            # Translations already in the work directory or the result cache
+            needed = list(dict.fromkeys(lang for _, _, langs in pending.values() for lang in langs))
+            translation_paths = {lang: workspace.path(f'translation_{LANGUAGE_CODES[lang]}.srt') for lang in needed}
+            for lang in needed:
+                stage_name = f'translation_{LANGUAGE_CODES[lang]}'
+                if not workspace.done(stage_name) and cache.get(translation_keys[lang], '.srt', translation_paths[lang]):
+                    logging.info(f"Reused cached {lang} translation.")
+                    workspace.complete(stage_name, [os.path.basename(translation_paths[lang])], cached=True)
+            missing = [lang for lang in needed if not workspace.done(f'translation_{LANGUAGE_CODES[lang]}')]
+
+            if missing:
+                cues = _transcribe_stage(video_path, input_lang, workspace, cache, transcript_key, report)
+                if cues is None:
+                    return None
+                report('translation', 0.6)
+                try:
+                    logging.info(f"Translating subtitles into {', '.join(missing)}...")
+                    with ThreadPoolExecutor(max_workers=len(missing), thread_name_prefix='translate') as executor:
+                        futures = {
+                            lang: executor.submit(translate_cues, cues, LANGUAGE_CODES[input_lang], LANGUAGE_CODES[lang])
+                            for lang in missing
+                        }
+                        for lang, future in futures.items():
+                            future.result().write(translation_paths[lang])
+                            cache.put(translation_keys[lang], '.srt', translation_paths[lang])
+                            workspace.complete(f'translation_{LANGUAGE_CODES[lang]}', [os.path.basename(translation_paths[lang])])
+                    logging.info("Translation completed.")
+                except Exception as e:
+                    logging.error(f"Failed to translate SRT file: {e}")
+                    return None
+
+            rendered_paths = {name: workspace.path(f'render_{name}{container}') for name in pending}
+            todo = [name for name in pending if not workspace.done(f'render_{name}')]
+            if todo:
+                report('render', 0.7)
+                try:
+                    with stage('render', subtitle_mode=subtitle_mode, source_bytes=os.path.getsize(video_path),
+                               outputs=len(todo), languages=len(needed)):
+                        if subtitle_mode == BURN_IN:
+                            logging.info(f"Adding subtitles to {len(todo)} videos from one decode")
+                            burn_subtitles_multi(video_path, [(translation_paths[name], rendered_paths[name]) for name in todo])
+                        else:
+                            logging.info(f"Adding {len(needed)} subtitle tracks to video, saving to {rendered_paths['tracks']}")
+                            mux_subtitle_tracks(video_path, [
+                                (translation_paths[lang], SUBTITLE_LANGUAGE_TAGS.get(LANGUAGE_CODES[lang]))
+                                for lang in output_langs
+                            ], rendered_paths['tracks'])
+                except Exception as e:
+                    logging.error(f"Failed to add subtitles to video: {e}")
+                    _remove_partial([rendered_paths[name] for name in todo])
+                    return None
+                for name in todo:
+                    workspace.complete(f'render_{name}', [os.path.basename(rendered_paths[name])])
+                logging.info("Subtitles added to video.")
+
+            for name, (key, final_path, _) in pending.items():
+                cache.put(key, container, rendered_paths[name])
+                shutil.move(rendered_paths[name], final_path)
+
+        results = {lang: final_path for _, final_path, langs in renders.values() for lang in langs}
+        logging.info(f"Processed videos with subtitles are available at {sorted(set(results.values()))}")
+        report('done', 1.0)
+        succeeded = True
+        return results
     except Exception as e:
         logging.error(f"An unexpected error occurred: {e}")
         return None
+    finally:
+        # Clean up intermediate files
+        if workspace is not None and (succeeded or not keep_on_failure):
+            workspace.cleanup()
+        elif workspace is not None:
+            workspace.release()
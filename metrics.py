@@ -0,0 +1,213 @@
+import cProfile
+import json
+import logging
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Write one JSON object per finished stage to this file
+METRICS_JSONL = os.getenv('LINGUAPIX_METRICS_JSONL')
+# Serve the Prometheus text format on this port
+METRICS_PORT = os.getenv('LINGUAPIX_METRICS_PORT')
+# Comma-separated stage names to run under cProfile, or "all"; profiles go to PROFILE_DIR
+PROFILE_STAGES = {s.strip() for s in os.getenv('LINGUAPIX_PROFILE_STAGES', '').split(',') if s.strip()}
+PROFILE_DIR = os.getenv('LINGUAPIX_PROFILE_DIR', 'profiles')
+
+logger = logging.getLogger(__name__)
+
+_sinks = []
+_hooks = []
+_sinks_lock = threading.Lock()
+
+
+def add_sink(sink):
+    """ Send every finished stage record to `sink`, an object with an emit(record) method """
+    with _sinks_lock:
+        _sinks.append(sink)
+
+
+def add_stage_hook(hook):
+    """
+    Register a hook run around every stage. `hook(name, record)` is called when the stage starts
+    and must return a context manager that is exited when the stage ends.
+    """
+    with _sinks_lock:
+        _hooks.append(hook)
+
+
+def _usage():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own, children
+
+
+@contextmanager
+def stage(name, **fields):
+    """
+    Measure a pipeline stage. Wall time, CPU time (including waited-for children such as ffmpeg)
+    and peak RSS are recorded when the block exits, together with `fields`, which describe the
+    input (e.g. audio_seconds=..., cues=..., bytes=..., model=...). The yielded dict can be
+    updated inside the block with sizes that are only known once the work is done.
+
+    CPU time is process-wide, so stages running concurrently in other threads are included.
+    """
+    record = {'stage': name, **fields}
+    own_before, children_before = _usage()
+    started = time.perf_counter()
+
+    thread = threading.current_thread()
+    thread_name = thread.name
+    # Show the stage in thread dumps (py-spy dump, faulthandler) while it runs
+    thread.name = f"{thread_name}:{name}"
+    with _sinks_lock:
+        hooks = [hook(name, record) for hook in _hooks]
+    for hook in hooks:
+        hook.__enter__()
+    try:
+        yield record
+        record['ok'] = True
+    except BaseException:
+        record['ok'] = False
+        raise
+    finally:
+        for hook in reversed(hooks):
+            hook.__exit__(None, None, None)
+        thread.name = thread_name
+        own_after, children_after = _usage()
+        record['duration_seconds'] = time.perf_counter() - started
+        record['cpu_seconds'] = (
+            own_after.ru_utime + own_after.ru_stime - own_before.ru_utime - own_before.ru_stime
+            + children_after.ru_utime + children_after.ru_stime - children_before.ru_utime - children_before.ru_stime
+        )
+        # ru_maxrss is in kilobytes on Linux
+        record['peak_rss_bytes'] = own_after.ru_maxrss * 1024
+        record['peak_rss_growth_bytes'] = (own_after.ru_maxrss - own_before.ru_maxrss) * 1024
+        record['peak_child_rss_bytes'] = children_after.ru_maxrss * 1024
+        record['timestamp'] = time.time()
+        _emit(record)
+
+
+def _emit(record):
+    with _sinks_lock:
+        sinks = list(_sinks)
+    for sink in sinks:
+        try:
+            sink.emit(record)
+        except Exception as e:
+            logger.error(f"Metrics sink {sink!r} failed: {e}")
+
+
+class JsonLinesSink:
+    """ Appends each stage record to a file as one JSON object per line """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        line = json.dumps(record, default=str)
+        with self._lock, open(self.path, 'a', encoding='utf-8') as file:
+            file.write(line + '\n')
+
+
+class PrometheusSink:
+    """
+    Aggregates stage records into Prometheus counters per stage: runs, failures, total wall
+    and CPU seconds, and the sums of every numeric input size. Peak RSS is exported as a gauge.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+        self._peak_rss = 0
+
+    def emit(self, record):
+        with self._lock:
+            totals = self._totals.setdefault(record['stage'], {})
+            totals['runs'] = totals.get('runs', 0) + 1
+            totals['failures'] = totals.get('failures', 0) + (0 if record.get('ok') else 1)
+            for key, value in record.items():
+                if key in ('timestamp', 'ok') or key.startswith('peak_'):
+                    continue
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    totals[key] = totals.get(key, 0) + value
+            self._peak_rss = max(self._peak_rss, record.get('peak_rss_bytes', 0))
+
+    def render(self):
+        """ Return the metrics in the Prometheus text exposition format """
+        lines = []
+        with self._lock:
+            names = sorted({key for totals in self._totals.values() for key in totals})
+            for key in names:
+                metric = f"linguapix_stage_{key}_total"
+                lines.append(f"# TYPE {metric} counter")
+                for stage_name, totals in sorted(self._totals.items()):
+                    if key in totals:
+                        lines.append(f'{metric}{{stage="{stage_name}"}} {totals[key]}')
+            lines.append("# TYPE linguapix_peak_rss_bytes gauge")
+            lines.append(f"linguapix_peak_rss_bytes {self._peak_rss}")
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, host='0.0.0.0'):
+        """ Serve render() at /metrics from a daemon thread """
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') != '/metrics':
+                    self.send_error(404)
+                    return
+                body = sink.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+        logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+        return server
+
+
+@contextmanager
+def _profile_stage(name, record):
+    """ Stage hook that runs the selected stages under cProfile and dumps one .prof file per run """
+    if 'all' not in PROFILE_STAGES and name not in PROFILE_STAGES:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{name}_{int(time.time() * 1000)}_{threading.get_ident()}.prof")
+        profiler.dump_stats(path)
+        record['profile'] = path
+
+
+def configure_from_env():
+    """ Set up the sinks and the profiling hook selected by the LINGUAPIX_METRICS_* / PROFILE_* variables """
+    if METRICS_JSONL:
+        add_sink(JsonLinesSink(METRICS_JSONL))
+    if METRICS_PORT:
+        sink = PrometheusSink()
+        add_sink(sink)
+        try:
+            sink.serve(int(METRICS_PORT))
+        except OSError as e:
+            # Another process (e.g. a second Streamlit worker) already serves this port
+            logger.error(f"Could not serve metrics on port {METRICS_PORT}: {e}")
+    if PROFILE_STAGES:
+        add_stage_hook(_profile_stage)
+
+
+configure_from_env()
@@ -0,0 +1,190 @@
+import importlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from asr_backends import load_pipeline, resolve_backend
+from metrics import stage
+
+YORUBA_ASR_MODEL = "neoform-ai/whisper-medium-yoruba"
+FON_ASR_MODEL = "chrisjay/fonxlsr"
+
+# Total memory the loaded ASR models may occupy before idle ones are evicted,
+# and how long a model may sit unused before the sweeper drops it.
+MEMORY_BUDGET_MB = int(os.getenv('LINGUAPIX_ASR_MEMORY_MB', '4096'))
+IDLE_TIMEOUT = float(os.getenv('LINGUAPIX_ASR_IDLE_SECONDS', '900'))
+# Optional "module:function" that builds pipelines instead of transformers, e.g. a local stand-in
+# for benchmarks. An environment variable so spawned ASR worker processes pick it up too.
+PIPELINE_LOADER = os.getenv('LINGUAPIX_ASR_LOADER')
+# Comma-separated model ids to preload at startup, e.g. "neoform-ai/whisper-medium-yoruba".
+WARMUP_MODELS = [m.strip() for m in os.getenv('LINGUAPIX_ASR_WARMUP', '').split(',') if m.strip()]
+
+logger = logging.getLogger(__name__)
+
+
+def _load_pipeline(model_id, backend):
+    """ Build an ASR pipeline for the given model id on the given backend """
+    if PIPELINE_LOADER:
+        module_name, _, function_name = PIPELINE_LOADER.partition(':')
+        return getattr(importlib.import_module(module_name), function_name)(model_id)
+    return load_pipeline(model_id, backend)
+
+
+def _estimate_size(pipe):
+    """ Approximate the memory held by a pipeline from its model parameters, in bytes """
+    # Backends whose weights are not torch parameters report their own size
+    if getattr(pipe, 'model_bytes', None) is not None:
+        return pipe.model_bytes
+    model = getattr(pipe, 'model', None)
+    if model is None or not hasattr(model, 'parameters'):
+        return 0
+    return sum(p.numel() * p.element_size() for p in model.parameters())
+
+
+class _Entry:
+    __slots__ = ('pipe', 'size', 'last_used', 'users', 'lock')
+
+    def __init__(self, pipe, size):
+        self.pipe = pipe
+        self.size = size
+        self.last_used = time.monotonic()
+        self.users = 0
+        # Inference on a shared pipeline is serialised: torch already spreads a
+        # single call over all cores, and pipelines keep per-call state.
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of ASR pipelines, keyed by (model id, backend). Each pair is loaded
+    at most once, shared by every request, and evicted least-recently-used first when the memory budget is
+    exceeded or when it has been idle for longer than the idle timeout.
+    """
+
+    def __init__(self, memory_budget_mb=MEMORY_BUDGET_MB, idle_timeout=IDLE_TIMEOUT, loader=_load_pipeline):
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.idle_timeout = idle_timeout
+        self.loader = loader
+        self._entries = {}
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def _get_entry(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.users += 1
+                return entry
+            load_lock = self._loading.setdefault(key, threading.Lock())
+
+        # Only one thread loads a given model; the others wait for it here.
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.users += 1
+                    return entry
+
+            model_id, backend = key
+            logger.info(f"Loading ASR model {model_id} ({backend})")
+            started = time.monotonic()
+            with stage('model_load', model=model_id, backend=backend) as record:
+                pipe = self.loader(model_id, backend)
+                entry = _Entry(pipe, _estimate_size(pipe))
+                record['model_bytes'] = entry.size
+            logger.info(f"Loaded ASR model {model_id} ({backend}) in {time.monotonic() - started:.1f}s "
+                        f"({entry.size / 1024 / 1024:.0f} MB)")
+
+            with self._lock:
+                entry.users += 1
+                self._entries[key] = entry
+                self._loading.pop(key, None)
+                self._evict_over_budget(keep=key)
+            return entry
+
+    def _evict_over_budget(self, keep=None):
+        """ Drop idle models, oldest first, until the loaded set fits the budget. Caller holds the lock """
+        total = sum(e.size for e in self._entries.values())
+        candidates = sorted(
+            (e.last_used, key) for key, e in self._entries.items()
+            if key != keep and e.users == 0
+        )
+        for _, key in candidates:
+            if total <= self.memory_budget:
+                break
+            total -= self._entries.pop(key).size
+            logger.info(f"Evicted ASR model {key} to stay within the memory budget")
+
+    def evict_idle(self):
+        """ Drop every model that has not been used for longer than the idle timeout """
+        now = time.monotonic()
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.users == 0 and now - entry.last_used > self.idle_timeout:
+                    del self._entries[key]
+                    logger.info(f"Evicted idle ASR model {key}")
+
+    @contextmanager
+    def acquire(self, model_id, backend=None):
+        """
+        Borrow the pipeline for a model, loading it on first use. The pipeline is held
+        exclusively for the duration of the block.
+
+        Args:
+            model_id (str): Hugging Face model id of the ASR model.
+            backend (str, optional): Inference backend. Defaults to LINGUAPIX_ASR_BACKEND.
+        """
+        self.evict_idle()
+        entry = self._get_entry((model_id, resolve_backend(backend)))
+        try:
+            with entry.lock:
+                yield entry.pipe
+        finally:
+            with self._lock:
+                entry.users -= 1
+                entry.last_used = time.monotonic()
+
+    def warmup(self, model_ids, backend=None):
+        """
+        Load the given models in a background thread so the first request does not pay for it.
+
+        Args:
+            model_ids (list of str): Models to load.
+            backend (str, optional): Inference backend. Defaults to LINGUAPIX_ASR_BACKEND.
+
+        Returns:
+            threading.Thread: The started daemon thread.
+        """
+        def run():
+            for model_id in model_ids:
+                try:
+                    with self.acquire(model_id, backend):
+                        pass
+                except Exception as e:
+                    logger.error(f"Failed to warm up ASR model {model_id}: {e}")
+
+        thread = threading.Thread(target=run, name="asr-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def loaded(self):
+        """ Return the (model id, backend) pairs currently held in memory """
+        with self._lock:
+            return list(self._entries)
+
+
+registry = ModelRegistry()
+
+
+def get_registry():
+    """ Return the process-wide model registry """
+    return registry
+
+
+def warmup_from_env():
+    """ Start preloading the models listed in LINGUAPIX_ASR_WARMUP, if any """
+    if not WARMUP_MODELS:
+        return None
+    return registry.warmup(WARMUP_MODELS)
@@ -0,0 +1,155 @@
+import bisect
+import os
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from add_subtitles import add_subtitles_to_video
+from subtitles import CueList, read_subtitles
+
+# Number of segments encoded at the same time
+BURN_WORKERS = int(os.getenv('LINGUAPIX_BURN_WORKERS', str(min(4, os.cpu_count() or 1))))
+# Videos shorter than this are not worth splitting
+MIN_SEGMENT_SECONDS = float(os.getenv('LINGUAPIX_MIN_SEGMENT_SECONDS', '20'))
+
+def probe_video_frames(video_path):
+    """
+    List the presentation times of every video frame and of the keyframes among them.
+
+    Args:
+        video_path (str): Path to the video file.
+
+    Returns:
+        tuple: (frame_times, keyframe_times), both sorted lists of seconds relative to the start of the file.
+    """
+    start = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_entries', 'format=start_time', '-of', 'csv=p=0', video_path],
+        capture_output=True, text=True, check=True,
+    ).stdout.strip()
+    offset = float(start) if start and start != 'N/A' else 0.0
+
+    packets = subprocess.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'packet=pts_time,flags',
+         '-of', 'csv=p=0', video_path],
+        capture_output=True, text=True, check=True,
+    ).stdout.split()
+
+    frame_times = []
+    keyframe_times = []
+    for packet in packets:
+        pts_time, _, flags = packet.partition(',')
+        if pts_time == 'N/A':
+            continue
+        time = float(pts_time) - offset
+        frame_times.append(time)
+        if 'K' in flags:
+            keyframe_times.append(time)
+    frame_times.sort()
+    keyframe_times.sort()
+    return frame_times, keyframe_times
+
+
+def plan_segments(frame_times, keyframe_times, segments):
+    """
+    Choose up to `segments` cut points at keyframes, as close as possible to an even split.
+
+    Returns:
+        list of tuple: (start_time, frame_count) for each segment, in order.
+    """
+    if not frame_times:
+        return []
+    duration = frame_times[-1]
+    cuts = [frame_times[0]]
+    for i in range(1, segments):
+        target = duration * i / segments
+        position = bisect.bisect_left(keyframe_times, target)
+        nearest = min(keyframe_times[max(0, position - 1):position + 1], key=lambda k: abs(k - target), default=None)
+        if nearest is not None and nearest > cuts[-1]:
+            cuts.append(nearest)
+
+    plan = []
+    for i, cut in enumerate(cuts):
+        first = bisect.bisect_left(frame_times, cut)
+        last = bisect.bisect_left(frame_times, cuts[i + 1]) if i + 1 < len(cuts) else len(frame_times)
+        plan.append((cut, last - first))
+    return plan
+
+
+def _encode_segment(video_path, srt_path, start, frame_count, output_path, threads):
+    """ Encode `frame_count` frames starting at the keyframe at `start`, burning in the segment's subtitles """
+    command = [
+        'ffmpeg', '-nostdin', '-loglevel', 'error', '-y',
+        '-ss', f'{start:.6f}',           # Seek to the keyframe the segment starts on
+        '-i', video_path,
+        '-frames:v', str(frame_count),   # Stop exactly before the next segment's first frame
+        '-an',                           # Audio is copied from the source once at the end
+        '-fps_mode', 'passthrough',      # Keep every source frame and its timestamp, even in variable frame rate video
+        '-vf', f"subtitles='{srt_path}'",
+        '-c:v', 'libx264',
+        '-crf', '22',
+        '-preset', 'fast',
+        '-threads', str(threads),
+        output_path
+    ]
+    subprocess.run(command, check=True)
+
+
+def burn_subtitles_parallel(video_path, srt_path, output_path, workers=BURN_WORKERS):
+    """
+    Burns subtitles into a video by encoding keyframe-aligned segments concurrently and joining
+    them with the concat demuxer. The audio is stream-copied from the source. Short videos, and
+    videos with too few keyframes to split, go through add_subtitles_to_video instead.
+
+    Args:
+    video_path (str): Path to the video file.
+    srt_path (str or CueList): Path to the SRT subtitle file, or the cues themselves.
+    output_path (str): Path to save the output video file with subtitles.
+    workers (int, optional): Maximum number of segments encoded at once.
+
+    Raises:
+    subprocess.CalledProcessError: If probing, encoding or concatenation fails.
+    """
+    frame_times, keyframe_times = probe_video_frames(video_path)
+    duration = frame_times[-1] if frame_times else 0.0
+    segments = min(workers, int(duration // MIN_SEGMENT_SECONDS))
+    plan = plan_segments(frame_times, keyframe_times, segments) if segments > 1 else []
+    if len(plan) < 2:
+        add_subtitles_to_video(video_path, srt_path, output_path)
+        return
+
+    cues = srt_path if isinstance(srt_path, CueList) else read_subtitles(srt_path)
+    threads = max(1, (os.cpu_count() or 1) // len(plan))
+    work_dir = tempfile.mkdtemp(prefix='burn_', dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        jobs = []
+        for i, (start, frame_count) in enumerate(plan):
+            end = plan[i + 1][0] if i + 1 < len(plan) else float('inf')
+            segment_srt = os.path.join(work_dir, f'segment_{i:03}.srt')
+            # A cue that spans the boundary is clipped into both segments, so it stays on screen
+            # across the cut without ever being drawn twice on the same frame
+            cues.window(start, end).write(segment_srt)
+            jobs.append((video_path, segment_srt, start, frame_count, os.path.join(work_dir, f'segment_{i:03}.mp4'), threads))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(_encode_segment, *job) for job in jobs]:
+                future.result()
+
+        list_path = os.path.join(work_dir, 'segments.txt')
+        with open(list_path, 'w', encoding='utf-8') as file:
+            for job in jobs:
+                file.write(f"file '{job[4]}'\n")
+
+        command = [
+            'ffmpeg', '-nostdin', '-loglevel', 'error', '-y',
+            '-f', 'concat', '-safe', '0', '-i', list_path,   # Encoded segments, joined without re-encoding
+            '-i', video_path,                                # Original audio
+            '-map', '0:v', '-map', '1:a?',
+            '-c', 'copy',
+            output_path
+        ]
+        subprocess.run(command, check=True)
+        print(f"Subtitles have been added successfully to {output_path} using {len(plan)} segments")
+    finally:
+        for name in os.listdir(work_dir):
+            os.remove(os.path.join(work_dir, name))
+        os.rmdir(work_dir)
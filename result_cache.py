@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+RESULT_CACHE_DIR = os.getenv('LINGUAPIX_RESULT_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'linguapix', 'results'))
+RESULT_CACHE_MB = int(os.getenv('LINGUAPIX_RESULT_CACHE_MB', '10240'))
+
+# Identifies the translation backend in cache keys, so switching engines invalidates old results
+MT_ENGINE = 'modernmt'
+# Eviction removes entries until the cache is down to this fraction of its cap
+EVICT_TO = 0.9
+
+
+def hash_file(path, block_size=1024 * 1024):
+    """ Return the SHA-256 hex digest of a file's contents, read in blocks """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def key_digest(key):
+    """ Return a stable hex digest identifying a cache key """
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _place(source, destination):
+    """
+    Copy source to destination. Entries are never hard-linked to the files handed out, which
+    would keep their blocks on disk after eviction and let the cache outgrow its cap.
+    """
+    if os.path.exists(destination):
+        os.remove(destination)
+    # Uses copy_file_range on Linux, which shares blocks on filesystems that support it
+    shutil.copyfile(source, destination)
+
+
+class ResultCache:
+    """
+    Content-addressed store for pipeline outputs. Entries are files named after a hash of
+    their key; a file's modification time records its last use, and the least recently used
+    files are removed once the directory grows past `max_mb`.
+
+    The size of the directory is scanned once and then tracked as entries are written, so a
+    write only lists the directory when the cap may have been reached; eviction then goes down
+    to EVICT_TO of the cap, so the next scan is many writes away.
+    """
+
+    def __init__(self, root=RESULT_CACHE_DIR, max_mb=RESULT_CACHE_MB):
+        self.root = root
+        self.max_bytes = max_mb * 1024 * 1024
+        self._lock = threading.Lock()
+        # Bytes in the directory as far as this process knows; None until the first write scans it
+        self._total = None
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key, extension):
+        return os.path.join(self.root, key_digest(key) + extension)
+
+    def get(self, key, extension, destination):
+        """
+        Copy a cached result to `destination`.
+
+        Args:
+            key (dict): Everything the result depends on.
+            extension (str): File extension of the result, e.g. '.srt'.
+            destination (str): Where to put the result.
+
+        Returns:
+            bool: True on a hit, False if the key is not cached.
+        """
+        path = self._path(key, extension)
+        with self._lock:
+            if not os.path.exists(path):
+                return False
+            os.utime(path)
+            _place(path, destination)
+        return True
+
+    def put(self, key, extension, source):
+        """
+        Store a copy of `source` under `key` and evict old entries if the cache is over its size cap.
+
+        Args:
+            key (dict): Everything the result depends on.
+            extension (str): File extension of the result, e.g. '.mp4'.
+            source (str): Path of the result to store.
+        """
+        path = self._path(key, extension)
+        with self._lock:
+            temporary_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            _place(source, temporary_path)
+            self._replace(temporary_path, path)
+
+    def read(self, key, extension):
+        """
+        Return the contents of a cached result.
+
+        Returns:
+            bytes: The cached data, or None if the key is not cached.
+        """
+        path = self._path(key, extension)
+        with self._lock:
+            try:
+                with open(path, 'rb') as file:
+                    data = file.read()
+            except FileNotFoundError:
+                return None
+            os.utime(path)
+        return data
+
+    def write(self, key, extension, data):
+        """ Store `data` under `key` and evict old entries if the cache is over its size cap """
+        path = self._path(key, extension)
+        with self._lock:
+            temporary_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(temporary_path, 'wb') as file:
+                file.write(data)
+            self._replace(temporary_path, path)
+
+    def _replace(self, temporary_path, path):
+        """ Move a new entry into place, update the tracked size and evict if the cap may be reached """
+        size = os.path.getsize(temporary_path)
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        os.replace(temporary_path, path)
+        if self._total is None:
+            self._evict(self.max_bytes)
+        else:
+            self._total += size - replaced
+            if self._total > self.max_bytes:
+                # Other processes write to the same directory, so only a scan gives the real size
+                self._evict(int(self.max_bytes * EVICT_TO))
+
+    def _evict(self, target_bytes):
+        """ Scan the directory and remove the least recently used entries past `target_bytes` """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.root):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        if total > self.max_bytes:
+            for _, size, path in sorted(entries):
+                if total <= target_bytes:
+                    break
+                os.remove(path)
+                total -= size
+        self._total = total
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """ Return the process-wide result cache, creating its directory on first use """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+        return _cache
@@ -0,0 +1,113 @@
+"""
+Streaming transcription and translation. The ASR side yields finalized cues piece by piece
+while it works through the audio, and translation consumes them concurrently, so by the time
+the last piece is transcribed most of the transcript is already translated.
+
+The two sides are connected by a bounded queue: when translation falls behind, transcription
+blocks on the full queue instead of piling up untranslated cues.
+"""
+import os
+import queue
+import threading
+
+from metrics import stage
+from subtitles import CueList
+from transcription import iter_transcribed_cues
+from translation import BATCH_SIZE, translate_cues
+
+# Transcribed pieces that may wait for translation before transcription pauses
+STREAM_QUEUE_CHUNKS = int(os.getenv('LINGUAPIX_STREAM_QUEUE_CHUNKS', '4'))
+
+# Seconds between checks for a stopped consumer while the queue is full
+_PUT_POLL_SECONDS = 0.5
+_DONE = object()
+
+
+class _Failure:
+    """ Carries an exception raised by the producer to the consumer """
+
+    __slots__ = ('error',)
+
+    def __init__(self, error):
+        self.error = error
+
+
+def _produce(cue_pieces, pieces, stop):
+    """ Put every piece from the generator on the queue, then _DONE or the error that ended it """
+    def put(item):
+        while not stop.is_set():
+            try:
+                pieces.put(item, timeout=_PUT_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        for cues in cue_pieces:
+            if not put(cues):
+                return
+        put(_DONE)
+    except BaseException as e:
+        put(_Failure(e))
+    finally:
+        # Stops the remaining ASR work when the consumer gave up early
+        cue_pieces.close()
+
+
+def transcribe_and_translate(audio, model_id, input_lang, output_lang, backend=None, queue_size=STREAM_QUEUE_CHUNKS,
+                             batch_size=BATCH_SIZE):
+    """
+    Transcribe audio and translate its cues at the same time. Transcription runs in a
+    background thread; this thread translates whatever cues are ready, up to `batch_size`
+    at a time, while the rest of the audio is still being transcribed.
+
+    Args:
+        audio (numpy.ndarray): Mono float32 samples at 16 kHz.
+        model_id (str): The ASR model to use.
+        input_lang (str): The language code of the spoken language.
+        output_lang (str): The language code of the subtitles.
+        backend (str, optional): Inference backend. Defaults to LINGUAPIX_ASR_BACKEND.
+        queue_size (int, optional): Transcribed pieces that may wait for translation. Default is 4.
+        batch_size (int, optional): Maximum number of cue texts per ModernMT request. Default is 64.
+
+    Returns:
+        tuple: The transcribed CueList and the translated CueList, both complete.
+    """
+    pieces = queue.Queue(maxsize=max(1, queue_size))
+    stop = threading.Event()
+    producer = threading.Thread(
+        target=_produce, args=(iter_transcribed_cues(audio, model_id, backend), pieces, stop),
+        name='stream-asr', daemon=True,
+    )
+
+    transcribed = []
+    translated = []
+    finished = False
+    with stage('stream', model=model_id, source=input_lang, target=output_lang) as record:
+        producer.start()
+        try:
+            while not finished:
+                # Wait for the next piece, then take whatever else is ready, up to a full batch
+                batch = [pieces.get()]
+                while batch[-1] is not _DONE and not isinstance(batch[-1], _Failure) \
+                        and sum(len(cues) for cues in batch) < batch_size:
+                    try:
+                        batch.append(pieces.get_nowait())
+                    except queue.Empty:
+                        break
+                if isinstance(batch[-1], _Failure):
+                    raise batch[-1].error
+                if batch[-1] is _DONE:
+                    batch.pop()
+                    finished = True
+                if batch:
+                    cues = CueList.concat(batch)
+                    transcribed.append(cues)
+                    translated.append(translate_cues(cues, input_lang, output_lang, batch_size))
+        finally:
+            stop.set()
+            producer.join()
+        record['cues'] = sum(len(cues) for cues in transcribed)
+        record['batches'] = len(translated)
+    return CueList.concat(transcribed), CueList.concat(translated)
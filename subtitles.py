@@ -0,0 +1,198 @@
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+
+# One cue: a timing line followed by text up to the next blank line. The index line before
+# the timing line is optional and never inspected, so cue text that is a number is kept.
+_CUE = re.compile(
+    r'(\d+):(\d{2}):(\d{2})[,.](\d{3})[ \t]*-->[ \t]*(\d+):(\d{2}):(\d{2})[,.](\d{3})[^\n]*\n(.*?)(?=\n[ \t]*\n|\Z)',
+    re.DOTALL,
+)
+# VTT also allows MM:SS.mmm timestamps
+_VTT_SHORT_TIME = re.compile(r'(?m)(?<![\d:])(\d{2}:\d{2}\.\d{3})(?=[ \t]*-->|[ \t]*$|[ \t]+\S)')
+
+
+class CueList:
+    """
+    Compact, immutable list of subtitle cues: start and end times in seconds are kept in two
+    float64 arrays and the texts in a plain list, so timing fixups are array operations and
+    a long transcript costs three objects instead of one per cue.
+    """
+
+    __slots__ = ('starts', 'ends', 'texts')
+
+    def __init__(self, starts, ends, texts):
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.ends = np.asarray(ends, dtype=np.float64)
+        self.texts = list(texts)
+        if not (len(self.starts) == len(self.ends) == len(self.texts)):
+            raise ValueError("starts, ends and texts must have the same length.")
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __iter__(self):
+        return zip(self.starts.tolist(), self.ends.tolist(), self.texts)
+
+    def __repr__(self):
+        return f"CueList({len(self)} cues)"
+
+    @classmethod
+    def from_chunks(cls, chunks):
+        """
+        Build cues from ASR pipeline chunks ({'text': ..., 'timestamp': (start, end)}).
+        A missing end time is replaced by the start time.
+        """
+        count = len(chunks)
+        times = np.empty((count, 2), dtype=np.float64)
+        for i, chunk in enumerate(chunks):
+            start, end = chunk['timestamp']
+            times[i, 0] = start or 0.0
+            times[i, 1] = times[i, 0] if end is None else end
+        return cls(times[:, 0], times[:, 1], [chunk['text'].strip() for chunk in chunks])
+
+    @classmethod
+    def concat(cls, cue_lists):
+        """ Join several cue lists, in order, into one """
+        cue_lists = list(cue_lists)
+        if not cue_lists:
+            return cls([], [], [])
+        return cls(
+            np.concatenate([cues.starts for cues in cue_lists]),
+            np.concatenate([cues.ends for cues in cue_lists]),
+            [text for cues in cue_lists for text in cues.texts],
+        )
+
+    def with_texts(self, texts):
+        """ Return cues with the same timings and new texts, e.g. translations """
+        return CueList(self.starts, self.ends, texts)
+
+    def fix_resets(self):
+        """
+        Move every cue that starts before the previous cue ended so it starts right after it,
+        keeping its duration. This undoes the timestamp resets Whisper produces between its
+        30-second windows.
+
+        Sequentially, start'[i] = max(start[i], end'[i-1]) and end'[i] = start'[i] + duration[i].
+        With c the running sum of durations, end'[i] = max over j <= i of (start[j] - c[j-1]) + c[i],
+        which is a cumulative maximum (floored at zero, the end of the imaginary cue before the first).
+        """
+        if not len(self):
+            return self
+        durations = self.ends - self.starts
+        totals = np.cumsum(durations)
+        previous_totals = totals - durations
+        # The running maximum starts at zero: the first cue only has to start after time zero
+        ends = np.maximum.accumulate(np.maximum(self.starts - previous_totals, 0.0)) + totals
+        return CueList(ends - durations, ends, self.texts)
+
+    def merge_gaps(self, threshold=1.0):
+        """
+        Merge consecutive cues separated by at most `threshold` seconds into one cue whose
+        text is the texts joined with spaces. Used for word-level timestamps.
+        """
+        if not len(self):
+            return self
+        gaps = self.starts[1:] - self.ends[:-1]
+        group_starts = np.concatenate(([0], np.flatnonzero(gaps > threshold) + 1))
+        group_ends = np.concatenate((group_starts[1:], [len(self)]))
+        texts = [' '.join(self.texts[a:b]) for a, b in zip(group_starts.tolist(), group_ends.tolist())]
+        return CueList(self.starts[group_starts], self.ends[group_ends - 1], texts)
+
+    def shifted(self, offset):
+        """ Return the cues moved by `offset` seconds """
+        return CueList(self.starts + offset, self.ends + offset, self.texts)
+
+    def window(self, start, end):
+        """
+        Return the cues visible between `start` and `end`, clipped to that window and shifted so
+        the window starts at zero. A cue that spans a window edge appears in both windows.
+        """
+        mask = (self.ends > start) & (self.starts < end)
+        indices = np.flatnonzero(mask)
+        return CueList(
+            np.maximum(self.starts[indices], start) - start,
+            np.minimum(self.ends[indices], end) - start,
+            [self.texts[i] for i in indices.tolist()],
+        )
+
+    def _timestamps(self, separator):
+        milliseconds = np.rint(np.concatenate((self.starts, self.ends)) * 1000).astype(np.int64)
+        milliseconds = np.maximum(milliseconds, 0)
+        hours, milliseconds = np.divmod(milliseconds, 3600000)
+        minutes, milliseconds = np.divmod(milliseconds, 60000)
+        seconds, milliseconds = np.divmod(milliseconds, 1000)
+        stamps = [
+            f"{h:02}:{m:02}:{s:02}{separator}{ms:03}"
+            for h, m, s, ms in zip(hours.tolist(), minutes.tolist(), seconds.tolist(), milliseconds.tolist())
+        ]
+        return stamps[:len(self)], stamps[len(self):]
+
+    def to_srt(self):
+        """ Serialize the cues as SRT text """
+        starts, ends = self._timestamps(',')
+        return "\n".join(
+            f"{idx}\n{start} --> {end}\n{text}\n"
+            for idx, (start, end, text) in enumerate(zip(starts, ends, self.texts), start=1)
+        )
+
+    def to_vtt(self):
+        """ Serialize the cues as WebVTT text """
+        starts, ends = self._timestamps('.')
+        body = "\n".join(f"{start} --> {end}\n{text}\n" for start, end, text in zip(starts, ends, self.texts))
+        return "WEBVTT\n\n" + body
+
+    def write(self, path):
+        """ Write the cues to an .srt or .vtt file, chosen by the extension """
+        content = self.to_vtt() if path.lower().endswith('.vtt') else self.to_srt()
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+
+def parse_srt(content):
+    """
+    Parse SRT (or WebVTT) text in a single pass.
+
+    Args:
+        content (str): The subtitle file contents.
+
+    Returns:
+        CueList: The cues, in file order.
+    """
+    content = content.replace('\r\n', '\n').lstrip('\ufeff')
+    matches = _CUE.findall(content)
+    if not matches:
+        return CueList([], [], [])
+    fields = np.array([match[:8] for match in matches], dtype=np.float64)
+    starts = fields[:, 0] * 3600 + fields[:, 1] * 60 + fields[:, 2] + fields[:, 3] / 1000
+    ends = fields[:, 4] * 3600 + fields[:, 5] * 60 + fields[:, 6] + fields[:, 7] / 1000
+    return CueList(starts, ends, [match[8].strip() for match in matches])
+
+
+def parse_vtt(content):
+    """ Parse WebVTT text, including its short MM:SS.mmm timestamps """
+    return parse_srt(_VTT_SHORT_TIME.sub(r'00:\1', content))
+
+
+def read_subtitles(path):
+    """ Read an .srt or .vtt file into a CueList """
+    with open(path, 'r', encoding='utf-8') as file:
+        content = file.read()
+    return parse_vtt(content) if path.lower().endswith('.vtt') else parse_srt(content)
+
+
+@contextmanager
+def subtitle_path(subtitles):
+    """
+    Yield a file path ffmpeg can read for `subtitles`. A path is yielded as is; a CueList is
+    written to a temporary SRT file that is removed when the block exits.
+    """
+    if not isinstance(subtitles, CueList):
+        yield subtitles
+        return
+    with tempfile.TemporaryDirectory(prefix='subtitles_') as directory:
+        yield subtitles.write(os.path.join(directory, 'subtitles.srt'))
@@ -1,73 +1,130 @@
-from transformers import pipeline
-import datetime
 import os
 
-def format_time(seconds):
-    """ Convert seconds to the SRT time format """
-    td = datetime.timedelta(seconds=seconds)
-    total_seconds = int(td.total_seconds())
-    hours, remainder = divmod(total_seconds, 3600)
-    minutes, seconds = divmod(remainder, 60)
-    milliseconds = int(td.microseconds / 1000)
-    return f"{hours:02}:{minutes:02}:{seconds:02},{milliseconds:03}"
-
-def create_srt(data):
-    """ Create SRT content from transcription data, adjusting for timestamp resets """
-    srt_content = []
-    last_end_time = 0  # Track the end time of the last chunk
-    
-    for idx, chunk in enumerate(data['chunks'], start=1):
-        # Adjust start and end times based on the last end time if they appear to reset
-        start_time = chunk['timestamp'][0]
-        end_time = chunk['timestamp'][1]
-
-        if start_time < last_end_time:
-            # Assume the chunk is meant to follow directly after the last one
-            start_time = last_end_time
-            end_time = start_time + (chunk['timestamp'][1] - chunk['timestamp'][0])
-
-        # Format timestamps for SRT
-        formatted_start_time = format_time(start_time)
-        formatted_end_time = format_time(end_time)
-        
-        # Update the last end time to the current chunk's end time
-        last_end_time = end_time
-
-        text = chunk['text'].strip()
-        srt_content.append(f"{idx}\n{formatted_start_time} --> {formatted_end_time}\n{text}\n")
-    
-    return "\n".join(srt_content)
+from asr_backends import resolve_backend
+from audio import SAMPLE_RATE
+from long_audio import LONG_AUDIO_SECONDS, iter_transcribed_segments, transcribe_long_audio
+from metrics import stage
+from model_registry import FON_ASR_MODEL, YORUBA_ASR_MODEL, get_registry
+from subtitles import CueList
+
+def create_srt(data, fix_resets=True):
+    """
+    Create SRT content from transcription data, adjusting for timestamp resets.
+    Pass fix_resets=False for data whose timestamps are already absolute, such as
+    the output of transcribe_long_audio.
+    """
+    return _to_cues(data, fix_resets).to_srt()
+
+def _pipeline_input(audio, srt_file_path):
+    """
+    Resolve the ASR pipeline input and the SRT output path for either an audio file path
+    or an in-memory array of samples at SAMPLE_RATE.
+    """
+    if isinstance(audio, str):
+        audio = os.path.abspath(audio)
+        if srt_file_path is None:
+            # Determine SRT file name based on the audio file path
+            srt_file_path = os.path.splitext(audio)[0] + ".srt"
+        return audio, srt_file_path
+    if srt_file_path is None:
+        raise ValueError("srt_file_path is required when transcribing in-memory audio.")
+    return {"raw": audio, "sampling_rate": SAMPLE_RATE}, srt_file_path
+
+def _transcribe(model_id, pipe_input, return_timestamps, backend=None):
+    """
+    Run ASR on a pipeline input. Long in-memory audio goes through the parallel chunked path.
+    `backend` selects the inference backend (see asr_backends); None uses LINGUAPIX_ASR_BACKEND.
+
+    Returns:
+    tuple: The transcription data and whether its timestamps may need reset fixing.
+    """
+    audio_seconds = len(pipe_input["raw"]) / SAMPLE_RATE if isinstance(pipe_input, dict) else None
+    long_audio = audio_seconds is not None and audio_seconds > LONG_AUDIO_SECONDS
+    backend = resolve_backend(backend)
+    with stage('asr_inference', model=model_id, backend=backend, audio_seconds=audio_seconds,
+               chunked=long_audio) as record:
+        if long_audio:
+            transcription = transcribe_long_audio(pipe_input["raw"], model_id, return_timestamps, backend)
+        else:
+            with get_registry().acquire(model_id, backend) as pipe:
+                transcription = pipe(pipe_input, return_timestamps=return_timestamps)
+        record['chunks'] = len(transcription.get('chunks', []))
+    return transcription, not long_audio
+
+def _to_cues(transcription, fix_resets):
+    """ Turn pipeline output into cues, undoing timestamp resets where they can occur """
+    cues = CueList.from_chunks(transcription['chunks'])
+    return cues.fix_resets() if fix_resets else cues
+
+def asr_model_for_language(input_lang):
+    """ Return the ASR model used for a spoken language name such as 'Fon' or 'French' """
+    return FON_ASR_MODEL if input_lang == 'Fon' else YORUBA_ASR_MODEL
+
+def transcribe_to_cues(audio, model_id=YORUBA_ASR_MODEL, backend=None):
+    """
+    Transcribe in-memory audio into subtitle cues without writing any file. The Fon model
+    produces word timestamps; every other model produces segment timestamps.
+
+    Args:
+    audio (numpy.ndarray): Mono float32 samples at 16 kHz.
+    model_id (str, optional): The ASR model to use. Default is the Whisper Yoruba model.
+    backend (str, optional): Inference backend, e.g. 'int8' or 'faster-whisper'. Defaults to LINGUAPIX_ASR_BACKEND.
+
+    Returns:
+    CueList: The transcribed cues.
+    """
+    return_timestamps = 'word' if model_id == FON_ASR_MODEL else True
+    transcription, fix_resets = _transcribe(model_id, {"raw": audio, "sampling_rate": SAMPLE_RATE}, return_timestamps,
+                                            backend)
+    return _to_cues(transcription, fix_resets)
+
+def iter_transcribed_cues(audio, model_id=YORUBA_ASR_MODEL, backend=None):
+    """
+    Transcribe in-memory audio piece by piece, yielding the cues of each piece as soon as they
+    are final. The audio is split at silences; long audio is transcribed ahead in the process
+    pool, short audio one piece at a time in this thread. Every cue has its absolute timing.
 
-def transcribe_and_create_srt(audio_file_path):
+    Args:
+    audio (numpy.ndarray): Mono float32 samples at 16 kHz.
+    model_id (str, optional): The ASR model to use. Default is the Whisper Yoruba model.
+    backend (str, optional): Inference backend, e.g. 'int8' or 'faster-whisper'. Defaults to LINGUAPIX_ASR_BACKEND.
+
+    Yields:
+    CueList: The cues of the next piece of audio, in order.
+    """
+    return_timestamps = 'word' if model_id == FON_ASR_MODEL else True
+    parallel = len(audio) / SAMPLE_RATE > LONG_AUDIO_SECONDS
+    for chunks in iter_transcribed_segments(audio, model_id, return_timestamps, resolve_backend(backend), parallel):
+        yield CueList.from_chunks(chunks)
+
+def transcribe_and_create_srt(audio, srt_file_path=None, backend=None):
     """ 
     Transcribe audio and create an SRT file specifically for Fon language audio inputs.
     This function should be called when the input language of the application is set to 'Yoruba', 'English', or 'French'.
     
     Args:
-    audio_file_path (str): The file path to the audio file to be transcribed.
+    audio (str or numpy.ndarray): The file path to the audio file, or mono float32 samples at 16 kHz.
+    srt_file_path (str, optional): Where to write the SRT file. Defaults to the audio path with an .srt
+        extension, and is required for in-memory audio.
+    backend (str, optional): Inference backend, e.g. 'int8' or 'faster-whisper'. Defaults to LINGUAPIX_ASR_BACKEND.
+
+    Returns:
+    str: The path of the SRT file, or None if the audio file does not exist.
     """
-    audio_file_path = os.path.abspath(audio_file_path)
-    # Initialize the ASR pipeline
-    pipe = pipeline("automatic-speech-recognition", model="neoform-ai/whisper-medium-yoruba")
-    
+    pipe_input, srt_file_path = _pipeline_input(audio, srt_file_path)
+
     # Ensure audio file exists
-    if not os.path.exists(audio_file_path):
+    if isinstance(pipe_input, str) and not os.path.exists(pipe_input):
         print("Error: Audio file does not exist.")
         return
 
-    # Perform transcription
-    transcription = pipe(audio_file_path, return_timestamps=True)
+    # Perform transcription with the shared ASR pipeline
+    transcription, fix_resets = _transcribe(YORUBA_ASR_MODEL, pipe_input, True, backend)
     
-    # Convert the transcription to SRT format
-    srt_output = create_srt(transcription)
-    
-    # Determine SRT file name based on the audio file path
-    srt_file_path = os.path.splitext(audio_file_path)[0] + ".srt"
-    
-    # Save the SRT content to a file
-    with open(srt_file_path, 'w') as file:
-        file.write(srt_output)
-        print(f"SRT file created: {srt_file_path}")
+    # Convert the transcription to SRT format and save it
+    _to_cues(transcription, fix_resets).write(srt_file_path)
+    print(f"SRT file created: {srt_file_path}")
+    return srt_file_path
 
 
 def create_srt_fon(data, merge_threshold=1.0):
@@ -83,70 +140,36 @@ def create_srt_fon(data, merge_threshold=1.0):
     Returns:
         str: The complete SRT content as a single string.
     """
-    srt_content = []
-    current_text = []
-    current_start = None
-    current_end = None
-    idx = 1
-
-    for chunk in data['chunks']:
-        start_time = chunk['timestamp'][0]
-        end_time = chunk['timestamp'][1]
-        text = chunk['text'].strip()
-
-        if current_start is None:
-            # Initialize the first segment
-            current_start = start_time
-            current_end = end_time
-            current_text.append(text)
-        else:
-            if start_time - current_end <= merge_threshold:
-                # Extend the current subtitle
-                current_end = end_time
-                current_text.append(text)
-            else:
-                # Write the current subtitle and start a new one
-                srt_content.append(f"{idx}\n{format_time(current_start)} --> {format_time(current_end)}\n{' '.join(current_text)}\n")
-                idx += 1
-                current_start = start_time
-                current_end = end_time
-                current_text = [text]
-
-    # Add the last subtitle entry
-    if current_text:
-        srt_content.append(f"{idx}\n{format_time(current_start)} --> {format_time(current_end)}\n{' '.join(current_text)}\n")
-    
-    return "\n".join(srt_content)
+    return CueList.from_chunks(data['chunks']).merge_gaps(merge_threshold).to_srt()
 
-def transcribe_and_create_srt_fon(audio_file_path):
+def transcribe_and_create_srt_fon(audio, srt_file_path=None, backend=None):
     """
     Transcribe audio and create an SRT file specifically for Fon language audio inputs.
     This function should be called when the input language of the application is set to 'Fon'.
     
     Args:
-    audio_file_path (str): The file path to the audio file to be transcribed.
+    audio (str or numpy.ndarray): The file path to the audio file, or mono float32 samples at 16 kHz.
+    srt_file_path (str, optional): Where to write the SRT file. Defaults to the audio path with an .srt
+        extension, and is required for in-memory audio.
+    backend (str, optional): Inference backend, e.g. 'int8' or 'faster-whisper'. Defaults to LINGUAPIX_ASR_BACKEND.
+
+    Returns:
+    str: The path of the SRT file, or None if the audio file does not exist.
     """
-    # Initialize the ASR pipeline
-    pipe = pipeline("automatic-speech-recognition", model="chrisjay/fonxlsr")
-    
+    pipe_input, srt_file_path = _pipeline_input(audio, srt_file_path)
+
     # Ensure audio file exists
-    if not os.path.exists(audio_file_path):
+    if isinstance(pipe_input, str) and not os.path.exists(pipe_input):
         print("Error: Audio file does not exist.")
         return
 
-    # Perform transcription with word timestamps
-    transcription = pipe(audio_file_path, return_timestamps='word')
-    
-    # Convert the transcription to SRT format with merged subtitles
-    srt_output = create_srt(transcription)
-    
-    # Determine SRT file name based on the audio file path
-    srt_file_path = os.path.splitext(audio_file_path)[0] + ".srt"
+    # Perform transcription with word timestamps using the shared ASR pipeline
+    transcription, fix_resets = _transcribe(FON_ASR_MODEL, pipe_input, 'word', backend)
     
-    # Save the SRT content to a file
-    with open(srt_file_path, 'w') as file:
-        file.write(srt_output)
-        print(f"SRT file created: {srt_file_path}")
+    # Convert the transcription to SRT format and save it
+    _to_cues(transcription, fix_resets).write(srt_file_path)
+    print(f"SRT file created: {srt_file_path}")
+    return srt_file_path
 
 
 
@@ -1,35 +1,113 @@
-from modernmt import ModernMT
+import os
+import threading
 
+from metrics import stage
+from subtitles import read_subtitles
+from translation_memory import get_translation_memory
 
-mmt = ModernMT("A864DC0E-CA4A-02D4-8BAC-0557155941C5")
-def translate_srt(file_path, input_lang, output_lang, output_file_path):
+
+# Maximum number of strings sent to ModernMT in a single request
+BATCH_SIZE = 64
+
+MODERNMT_API_KEY = os.getenv('MODERNMT_API_KEY', "A864DC0E-CA4A-02D4-8BAC-0557155941C5")
+
+# Created on the first translation, so importing this module does not load the ModernMT SDK
+mmt = None
+_mmt_lock = threading.Lock()
+
+
+def set_mt_client(client):
+    """
+    Replace the ModernMT client, e.g. with a local stand-in for benchmarks. The client only
+    needs a translate(source, target, texts) method returning objects with a `translation`.
+    """
+    global mmt
+    mmt = client
+
+
+def get_mt_client():
+    """ Return the ModernMT client, creating it on first use """
+    global mmt
+    with _mmt_lock:
+        if mmt is None:
+            from modernmt import ModernMT
+            mmt = ModernMT(MODERNMT_API_KEY)
+        return mmt
+
+
+def translate_texts(texts, input_lang, output_lang, batch_size=BATCH_SIZE, use_memory=True):
+    """
+    Translate a list of strings with as few ModernMT requests as possible. Strings already in
+    the translation memory are not sent at all, repeated strings are only sent once, and the
+    rest are sent in batches of at most `batch_size`.
+
+    Args:
+        texts (list of str): The strings to translate.
+        input_lang (str): The language code of the input strings.
+        output_lang (str): The language code of the target translation language.
+        batch_size (int): Maximum number of strings per ModernMT request.
+        use_memory (bool): Whether to read from and write to the translation memory.
+
+    Returns:
+        list of str: The translations, in the same order as `texts`.
+    """
+    unique_texts = list(dict.fromkeys(texts))
+    memory = get_translation_memory() if use_memory else None
+    translations = memory.get_many(input_lang, output_lang, unique_texts) if memory is not None else {}
+
+    pending = [text for text in unique_texts if text not in translations]
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        with stage('mt_batch', source=input_lang, target=output_lang, strings=len(batch),
+                   chars=sum(len(text) for text in batch)):
+            results = get_mt_client().translate(input_lang, output_lang, batch)
+        fresh = {text: result.translation for text, result in zip(batch, results)}
+        translations.update(fresh)
+        if memory is not None:
+            memory.put_many(input_lang, output_lang, fresh)
+
+    return [translations[text] for text in texts]
+
+
+def translate_cues(cues, input_lang, output_lang, batch_size=BATCH_SIZE):
+    """
+    Translate the texts of a set of subtitle cues in deduplicated batches, keeping their timings.
+
+    Args:
+        cues (CueList): The cues to translate.
+        input_lang (str): The language code of the cue texts.
+        output_lang (str): The language code of the target translation language.
+        batch_size (int, optional): Maximum number of cue texts per ModernMT request. Default is 64.
+
+    Returns:
+        CueList: The translated cues.
+    """
+    # Empty cues are kept as they are rather than sent for translation
+    positions = [i for i, text in enumerate(cues.texts) if text.strip()]
+    texts = [cues.texts[i] for i in positions]
+    with stage('translate_cues', source=input_lang, target=output_lang, cues=len(texts),
+               unique_cues=len(set(texts))):
+        translated_texts = translate_texts(texts, input_lang, output_lang, batch_size)
+
+    translated = list(cues.texts)
+    for position, translated_text in zip(positions, translated_texts):
+        translated[position] = translated_text
+    return cues.with_texts(translated)
+
+
+def translate_srt(file_path, input_lang, output_lang, output_file_path, batch_size=BATCH_SIZE):
     """
     Translates the content of an SRT file from one language to another using the ModernMT service.
     This function supports translations between English (en), French (fr), Fon (fon), and Yoruba (yo).
+    All cue texts are collected first and translated in deduplicated batches, then written back
+    with the original cue timings.
 
     Args:
         file_path (str): The path to the input SRT file.
         input_lang (str): The language code of the input file's language. Possible values are 'en', 'fr', 'fon', 'yo'.
         output_lang (str): The language code of the target translation language. Possible values are 'en', 'fr', 'fon', 'yo'.
         output_file_path (str): The path where the translated SRT file will be saved.
+        batch_size (int, optional): Maximum number of cue texts per ModernMT request. Default is 64.
     """
-    with open(file_path, 'r', encoding='utf-8') as file:
-        lines = file.readlines()
-    
-    translated_lines = []
-    for line in lines:
-        if line.strip().isdigit() or '-->' in line:
-            translated_lines.append(line)
-        else:
-            # Ensure that the line is not empty before attempting translation
-            if line.strip():
-                translation_result = mmt.translate(input_lang, output_lang, line.strip())
-                translated_text = translation_result.translation
-                translated_lines.append(translated_text + '\n')
-            else:
-                translated_lines.append('\n')  # Preserve empty lines
-    
-    with open(output_file_path, 'w', encoding='utf-8') as output_file:
-        output_file.writelines(translated_lines)
- 
-
+    cues = read_subtitles(file_path)
+    translate_cues(cues, input_lang, output_lang, batch_size).write(output_file_path)
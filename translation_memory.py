@@ -0,0 +1,150 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+TM_PATH = os.getenv('LINGUAPIX_TM_PATH', os.path.join(os.path.expanduser('~'), '.cache', 'linguapix', 'translation_memory.sqlite3'))
+# Number of entries kept in the in-memory front and in the on-disk store
+MEMORY_ENTRIES = int(os.getenv('LINGUAPIX_TM_MEMORY_ENTRIES', '10000'))
+DISK_ENTRIES = int(os.getenv('LINGUAPIX_TM_DISK_ENTRIES', '500000'))
+# Rows written between two checks of the on-disk store's size, which scans the whole table
+TRIM_INTERVAL = 1000
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    """ Normalize a string for use as a translation memory key """
+    return _WHITESPACE.sub(' ', unicodedata.normalize('NFC', text)).strip()
+
+
+class TranslationMemory:
+    """
+    Translation cache keyed by (source language, target language, normalized text).
+    Lookups go to an in-memory LRU first and fall back to an SQLite file, which is
+    trimmed back to `disk_entries` rows by dropping the least recently used ones after
+    every TRIM_INTERVAL rows written.
+    """
+
+    def __init__(self, path=TM_PATH, memory_entries=MEMORY_ENTRIES, disk_entries=DISK_ENTRIES):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        # Rows written since the store's size was last checked; starts full so the first write checks it
+        self._unchecked = TRIM_INTERVAL
+
+    def _connect(self):
+        if self._conn is None:
+            if self.path != ':memory:':
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS tm ("
+                " source TEXT, target TEXT, text TEXT, translation TEXT, last_used REAL,"
+                " PRIMARY KEY (source, target, text))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS tm_last_used ON tm (last_used)")
+        return self._conn
+
+    def _remember(self, key, translation):
+        self._memory[key] = translation
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, source_lang, target_lang, texts):
+        """
+        Look up cached translations.
+
+        Args:
+            source_lang (str): Source language code.
+            target_lang (str): Target language code.
+            texts (list of str): Strings to look up.
+
+        Returns:
+            dict: Maps each input string that was found to its cached translation.
+        """
+        found = {}
+        missing = {}
+        with self._lock:
+            for text in texts:
+                key = (source_lang, target_lang, normalize_text(text))
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[text] = self._memory[key]
+                else:
+                    missing.setdefault(key[2], []).append(text)
+
+            if not missing:
+                return found
+
+            conn = self._connect()
+            now = time.time()
+            keys = list(missing)
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT text, translation FROM tm WHERE source = ? AND target = ? AND text IN ({','.join('?' * len(batch))})",
+                    [source_lang, target_lang, *batch],
+                ).fetchall()
+                for normalized, translation in rows:
+                    self._remember((source_lang, target_lang, normalized), translation)
+                    for text in missing[normalized]:
+                        found[text] = translation
+                conn.executemany(
+                    "UPDATE tm SET last_used = ? WHERE source = ? AND target = ? AND text = ?",
+                    [(now, source_lang, target_lang, normalized) for normalized, _ in rows],
+                )
+            conn.commit()
+        return found
+
+    def put_many(self, source_lang, target_lang, translations):
+        """
+        Store translations in both tiers.
+
+        Args:
+            source_lang (str): Source language code.
+            target_lang (str): Target language code.
+            translations (dict): Maps source strings to their translations.
+        """
+        if not translations:
+            return
+        now = time.time()
+        rows = {normalize_text(text): translation for text, translation in translations.items()}
+        with self._lock:
+            for normalized, translation in rows.items():
+                self._remember((source_lang, target_lang, normalized), translation)
+            conn = self._connect()
+            conn.executemany(
+                "INSERT OR REPLACE INTO tm (source, target, text, translation, last_used) VALUES (?, ?, ?, ?, ?)",
+                [(source_lang, target_lang, normalized, translation, now) for normalized, translation in rows.items()],
+            )
+            self._unchecked += len(rows)
+            if self._unchecked >= TRIM_INTERVAL:
+                self._unchecked = 0
+                count = conn.execute("SELECT COUNT(*) FROM tm").fetchone()[0]
+                if count > self.disk_entries:
+                    conn.execute(
+                        "DELETE FROM tm WHERE rowid IN (SELECT rowid FROM tm ORDER BY last_used LIMIT ?)",
+                        (count - self.disk_entries,),
+                    )
+            conn.commit()
+
+
+_memory = None
+_memory_lock = threading.Lock()
+
+
+def get_translation_memory():
+    """ Return the process-wide translation memory, opening it on first use """
+    global _memory
+    with _memory_lock:
+        if _memory is None:
+            _memory = TranslationMemory()
+        return _memory
@@ -0,0 +1,244 @@
+"""
+Upload spooling. Every upload is written to disk in fixed-size chunks inside its own directory
+under UPLOAD_DIR, named by an unguessable token, while its size is checked against the limit
+and its SHA-256 is computed on the fly. No upload is ever held in memory as a whole, and two
+users uploading files with the same name never touch each other's files.
+
+Uploads sent to the file server go into directories the app reserves for the tokens it hands
+out, and all upload directories together are kept within UPLOAD_QUOTA_MB.
+
+The pipeline writes its outputs next to its input, so a job's results land in the same
+directory and are removed with it once it has been left untouched for UPLOAD_TTL_HOURS.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+UPLOAD_DIR = os.getenv('LINGUAPIX_UPLOAD_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'linguapix', 'uploads'))
+# Largest accepted upload
+MAX_UPLOAD_MB = int(os.getenv('LINGUAPIX_MAX_UPLOAD_MB', '4096'))
+# Upload directories, and the results in them, are removed once untouched for this long
+UPLOAD_TTL_HOURS = float(os.getenv('LINGUAPIX_UPLOAD_TTL_HOURS', '24'))
+# Most space all upload directories together may take; new uploads are refused beyond it
+UPLOAD_QUOTA_MB = int(os.getenv('LINGUAPIX_UPLOAD_QUOTA_MB', '20480'))
+UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv')
+MANIFEST_NAME = 'upload.json'
+
+_TOKEN = re.compile(r'^[0-9a-f]{32}$')
+_UNSAFE = re.compile(r'[^\w.-]+')
+
+
+class UploadError(ValueError):
+    """ An upload was refused: too large, out of order, over the quota, or not a video """
+
+
+def new_upload_token():
+    """ Return a fresh, unguessable upload token """
+    return uuid.uuid4().hex
+
+
+def is_upload_token(token):
+    """ Return whether `token` has the form of an upload token """
+    return bool(_TOKEN.match(token or ''))
+
+
+def reserve_upload(token, root=UPLOAD_DIR):
+    """
+    Create the directory of an upload the app has issued `token` for. The file server only
+    accepts chunks for tokens whose directory exists, so clients cannot invent their own.
+    """
+    if not is_upload_token(token):
+        raise UploadError("Invalid upload token.")
+    os.makedirs(os.path.join(root, token), exist_ok=True)
+
+
+def is_reserved(token, root=UPLOAD_DIR):
+    """ Return whether `token` names an upload directory the app has created """
+    return is_upload_token(token) and os.path.isdir(os.path.join(root, token))
+
+
+def upload_usage(root=UPLOAD_DIR):
+    """ Return the bytes taken by all upload directories, uploads and results alike """
+    total = 0
+    for directory, _, names in os.walk(root):
+        for name in names:
+            try:
+                total += os.stat(os.path.join(directory, name)).st_size
+            except OSError:
+                continue
+    return total
+
+
+def check_quota(incoming_bytes, root=UPLOAD_DIR, quota_bytes=UPLOAD_QUOTA_MB * 1024 * 1024, pending_bytes=0):
+    """
+    Refuse an upload that would take the upload directories past their quota.
+
+    Args:
+        incoming_bytes (int): Size of the new upload.
+        root (str, optional): Directory that holds the upload directories.
+        quota_bytes (int, optional): The quota. Default is LINGUAPIX_UPLOAD_QUOTA_MB.
+        pending_bytes (int, optional): Bytes still to arrive for uploads already in progress.
+
+    Raises:
+        UploadError: If the upload does not fit.
+    """
+    if upload_usage(root) + pending_bytes + incoming_bytes > quota_bytes:
+        raise UploadError("The server is out of space for uploads; try again later.")
+
+
+def safe_filename(name):
+    """ Reduce a client-supplied file name to a plain name that cannot leave its directory """
+    stem, extension = os.path.splitext(os.path.basename(name.replace('\\', '/')))
+    stem = _UNSAFE.sub('_', stem).strip('._') or 'video'
+    return stem[:100] + extension.lower()
+
+
+class UploadSpool:
+    """
+    One upload being written to disk. Chunks must arrive in order: each write says where it
+    starts, and a write that does not continue where the previous one ended is refused, so a
+    client that lost a response can ask for the current size and resume from there.
+    """
+
+    def __init__(self, token, filename, root=UPLOAD_DIR, max_bytes=MAX_UPLOAD_MB * 1024 * 1024, expected_size=0):
+        if not is_upload_token(token):
+            raise UploadError("Invalid upload token.")
+        self.filename = safe_filename(filename)
+        if not self.filename.endswith(VIDEO_EXTENSIONS):
+            raise UploadError(f"Only {', '.join(VIDEO_EXTENSIONS)} files can be uploaded.")
+        self.token = token
+        self.directory = os.path.join(root, token)
+        self.path = os.path.join(self.directory, self.filename)
+        self.max_bytes = max_bytes
+        # Size the client announced, counted against the quota until the upload is complete
+        self.expected_size = expected_size
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        # A restarted upload is not complete until it is finished again
+        manifest_path = os.path.join(self.directory, MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        self._file = open(self.path, 'wb')
+
+    def write(self, data, offset=None):
+        """
+        Append a chunk.
+
+        Args:
+            data (bytes): The chunk.
+            offset (int, optional): Where the chunk starts in the file; checked against the bytes received so far.
+
+        Returns:
+            int: The bytes received so far.
+
+        Raises:
+            UploadError: If the chunk is out of order or takes the upload past its size limit.
+        """
+        with self._lock:
+            if offset is not None and offset != self.size:
+                raise UploadError(f"Expected the chunk at byte {self.size}, got one at byte {offset}.")
+            if self.size + len(data) > self.max_bytes:
+                raise UploadError(f"Uploads are limited to {self.max_bytes // (1024 * 1024)} MB.")
+            self._file.write(data)
+            self._digest.update(data)
+            self.size += len(data)
+            return self.size
+
+    def finish(self):
+        """
+        Close the file and record its name, size and checksum in the upload's manifest.
+
+        Returns:
+            dict: The manifest.
+        """
+        with self._lock:
+            self._file.close()
+            manifest = {'filename': self.filename, 'size': self.size, 'sha256': self._digest.hexdigest(),
+                        'completed': time.time()}
+            temporary_path = os.path.join(self.directory, MANIFEST_NAME + '.tmp')
+            with open(temporary_path, 'w', encoding='utf-8') as file:
+                json.dump(manifest, file)
+            os.replace(temporary_path, os.path.join(self.directory, MANIFEST_NAME))
+        return manifest
+
+    def abort(self):
+        """ Close and delete the partial upload, and its directory if nothing else is in it """
+        with self._lock:
+            self._file.close()
+        try:
+            os.remove(self.path)
+            os.rmdir(self.directory)
+        except OSError:
+            pass
+
+
+def spool_file(source, filename, token=None, root=UPLOAD_DIR, max_bytes=MAX_UPLOAD_MB * 1024 * 1024,
+               chunk_size=UPLOAD_CHUNK_BYTES):
+    """
+    Copy a file-like object into a new upload directory in chunks.
+
+    Args:
+        source (file-like): Anything with a read(size) method, e.g. a Streamlit UploadedFile.
+        filename (str): The client-supplied file name.
+        token (str, optional): The upload token. Defaults to a new one.
+        root (str, optional): Directory that holds the upload directories.
+        max_bytes (int, optional): Size limit. Default is LINGUAPIX_MAX_UPLOAD_MB.
+        chunk_size (int, optional): Bytes read and written at a time. Default is 8 MB.
+
+    Returns:
+        dict: The upload's manifest, with its token and path added.
+
+    Raises:
+        UploadError: If the file is not a video, is too large or does not fit in the upload
+            quota. Nothing is left on disk.
+    """
+    purge_expired_uploads(root)
+    # Streamlit's UploadedFile knows its size up front
+    check_quota(getattr(source, 'size', 0), root)
+    spool = UploadSpool(token or new_upload_token(), filename, root, max_bytes)
+    try:
+        for chunk in iter(lambda: source.read(chunk_size), b''):
+            spool.write(chunk)
+    except BaseException:
+        spool.abort()
+        raise
+    return {**spool.finish(), 'token': spool.token, 'path': spool.path}
+
+
+def find_upload(token, root=UPLOAD_DIR):
+    """
+    Look up a finished upload.
+
+    Returns:
+        dict: The upload's manifest, with its token and path added, or None if it is not complete.
+    """
+    if not is_upload_token(token):
+        return None
+    try:
+        with open(os.path.join(root, token, MANIFEST_NAME), 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return {**manifest, 'token': token, 'path': os.path.join(root, token, manifest['filename'])}
+
+
+def purge_expired_uploads(root=UPLOAD_DIR, ttl_hours=UPLOAD_TTL_HOURS):
+    """ Remove upload directories in which nothing has been written for `ttl_hours` """
+    if not os.path.isdir(root):
+        return
+    cutoff = time.time() - ttl_hours * 3600
+    for entry in os.scandir(root):
+        try:
+            if entry.is_dir() and is_upload_token(entry.name) and entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except OSError:
+            continue
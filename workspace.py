@@ -0,0 +1,135 @@
+import json
+import os
+import shutil
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks on Windows; work directories are then not guarded against concurrent runs
+    fcntl = None
+
+WORK_ROOT = os.getenv('LINGUAPIX_WORK_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'linguapix', 'work'))
+# Whether a failed job's work directory is kept so a retry can resume from its last completed stage
+KEEP_FAILED_WORK = os.getenv('LINGUAPIX_KEEP_FAILED_WORK', '1') == '1'
+# Kept work directories are removed once untouched for this long
+WORK_TTL_HOURS = float(os.getenv('LINGUAPIX_WORK_TTL_HOURS', '24'))
+
+MANIFEST_NAME = 'manifest.json'
+LOCK_NAME = '.lock'
+
+
+def _lock_directory(directory):
+    """
+    Take the exclusive lock of a work directory without waiting.
+
+    Returns:
+        file: The open lock file, which holds the lock until it is closed, or None if another
+        run holds it or the directory was removed meanwhile.
+    """
+    if fcntl is None:
+        return open(os.devnull, 'w')
+    lock_path = os.path.join(directory, LOCK_NAME)
+    try:
+        lock_file = open(lock_path, 'a')
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # The run that held the lock may have removed the directory before letting go of it
+        if os.fstat(lock_file.fileno()).st_ino != os.stat(lock_path).st_ino:
+            raise OSError("The work directory was removed.")
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def purge_expired_workspaces(root=WORK_ROOT, ttl_hours=WORK_TTL_HOURS):
+    """ Remove work directories in which nothing has been written for `ttl_hours` and no run is active """
+    if not os.path.isdir(root):
+        return
+    cutoff = time.time() - ttl_hours * 3600
+    for entry in os.scandir(root):
+        try:
+            if not entry.is_dir():
+                continue
+            manifest_path = os.path.join(entry.path, MANIFEST_NAME)
+            touched = max(entry.stat().st_mtime, os.path.getmtime(manifest_path) if os.path.exists(manifest_path) else 0)
+        except OSError:
+            continue
+        if touched >= cutoff:
+            continue
+        lock_file = _lock_directory(entry.path)
+        if lock_file is not None:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            lock_file.close()
+
+
+class Workspace:
+    """
+    Private work directory for one pipeline job, with a manifest of the stages that have
+    completed. Creating a Workspace for an existing job id picks up where that job stopped.
+
+    Directories kept after a failure are removed once untouched for WORK_TTL_HOURS.
+
+    The directory is locked while the Workspace is open. A second run with the same job id
+    that starts while the first is still going gets a fresh directory of its own instead, so
+    neither can delete or overwrite the other's files.
+    """
+
+    def __init__(self, job_id, root=WORK_ROOT):
+        self.job_id = job_id
+        self._lock_file = None
+        # Failed jobs keep their directories for a retry; drop the ones nobody came back for
+        purge_expired_workspaces(root)
+        name = job_id
+        while self._lock_file is None:
+            self.root = os.path.join(root, name)
+            os.makedirs(self.root, exist_ok=True)
+            self._lock_file = _lock_directory(self.root)
+            name = f'{job_id}-{uuid.uuid4().hex[:8]}'
+        self._manifest_path = os.path.join(self.root, MANIFEST_NAME)
+        if os.path.exists(self._manifest_path):
+            with open(self._manifest_path, 'r', encoding='utf-8') as file:
+                self.manifest = json.load(file)
+        else:
+            self.manifest = {'job_id': job_id, 'created': time.time(), 'stages': {}}
+
+    def path(self, name):
+        """ Return the path of a file inside the work directory """
+        return os.path.join(self.root, name)
+
+    def done(self, stage):
+        """ Return whether a stage has completed and all the files it recorded still exist """
+        info = self.manifest['stages'].get(stage)
+        if info is None:
+            return False
+        return all(os.path.exists(self.path(name)) for name in info.get('files', []))
+
+    def complete(self, stage, files=(), **info):
+        """
+        Record a completed stage.
+
+        Args:
+            stage (str): Stage name, e.g. 'transcript'.
+            files (list of str, optional): Names of the files inside the work directory the stage produced.
+            **info: Extra details stored in the manifest.
+        """
+        self.manifest['stages'][stage] = {'files': list(files), 'completed': time.time(), **info}
+        temporary_path = self._manifest_path + '.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            json.dump(self.manifest, file, indent=2)
+        os.replace(temporary_path, self._manifest_path)
+
+    def release(self):
+        """ Let other runs use the work directory, which is kept for a later retry """
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def cleanup(self):
+        """ Delete the work directory and everything in it """
+        shutil.rmtree(self.root, ignore_errors=True)
+        self.release()